@@ -1,11 +1,77 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
 from .models import Comment, Follow, Group, Post
 
+# до скольки строк список считается точно; дальше - оценка
+EXACT_COUNT_LIMIT = 10000
 
-class PostAdmin(admin.ModelAdmin):
+
+class EstimatedCountPaginator(Paginator):
+    """Не делает ``COUNT(*)`` по всей таблице.
+
+    Считает не больше ``EXACT_COUNT_LIMIT + 1`` строк; если их больше,
+    для списка без фильтров берёт оценку по максимальному ``pk``, а для
+    отфильтрованного - сам предел.
+    """
+
+    @cached_property
+    def count(self):
+        capped = self.object_list.order_by()[:EXACT_COUNT_LIMIT + 1].count()
+        if capped <= EXACT_COUNT_LIMIT or self.object_list.query.has_filters():
+            return min(capped, EXACT_COUNT_LIMIT)
+        return max(self.object_list.aggregate(top=Max("pk"))["top"], capped)
+
+
+class CursorChangeList(ChangeList):
+    """Список, который листается по ``pk`` (``?id__lt=``) вместо номера страницы."""
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.next_cursor_url = None
+        rows = self.result_list
+        if ORDER_VAR in self.params or len(rows) < self.list_per_page:
+            return
+        if self.result_count > (self.page_num + 1) * self.list_per_page:
+            self.next_cursor_url = self.get_query_string({"id__lt": rows[len(rows) - 1].pk}, [PAGE_VAR])
+
+
+class FastChangeListAdmin(admin.ModelAdmin):
+    """Список без полного ``COUNT(*)`` с навигацией по курсору.
+
+    Поиск по ``@префикс`` ищет по началу имени пользователя в полях
+    ``username_search_fields`` диапазоном ``>= префикс``, который использует
+    индекс, в отличие от ``LIKE``; остальные запросы ищутся как обычно.
+    """
+    ordering = ("-id",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    username_search_fields = ()
+
+    def get_changelist(self, request, **kwargs):
+        return CursorChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        prefix = search_term.strip()
+        if not (prefix.startswith("@") and self.username_search_fields):
+            return super().get_search_results(request, queryset, search_term)
+        prefix = prefix[1:]
+        condition = Q()
+        for field in self.username_search_fields:
+            condition |= Q(**{f"{field}__gte": prefix, f"{field}__lt": prefix + "\U0010ffff"})
+        return queryset.filter(condition), False
+
+
+class PostAdmin(FastChangeListAdmin):
     list_display = ("pk", "text", "pub_date", "author")
+    list_select_related = ("author",)
     search_fields = ("text",)
+    username_search_fields = ("author__username",)
     list_filter = ("pub_date",)
+    raw_id_fields = ("author",)
+    autocomplete_fields = ("group",)
     empty_value_display = "-пусто-"
 
 
@@ -16,16 +82,22 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = ("-пусто-",)
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FastChangeListAdmin):
     list_display = ("pk", "text", "created", "author")
-    search_fields = ("text", "author")
+    list_select_related = ("author",)
+    search_fields = ("text",)
+    username_search_fields = ("author__username",)
     list_filter = ("created",)
+    raw_id_fields = ("post", "author")
     empty_value_display = "-пусто-"
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(FastChangeListAdmin):
     list_display = ("pk", "user", "author")
-    search_fields = ("user", "author")
+    list_select_related = ("user", "author")
+    search_fields = ("=user__username", "=author__username")
+    username_search_fields = ("user__username", "author__username")
+    raw_id_fields = ("user", "author")
 
 
 admin.site.register(Post, PostAdmin)
@@ -0,0 +1,75 @@
+"""Версионированные пространства ключей в общем кэше.
+
+Вместо удаления ключей по одному пространство инвалидируется увеличением
+его версии: все ключи, собранные ``versioned_key`` со старой версией,
+перестают читаться во всех воркерах, которые смотрят в тот же кэш.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+FEED = "feed"
+PAGE_PARAMS = ("page", "after", "before")
+
+
+def _version_key(namespace):
+    return f"ns:{namespace}"
+
+
+def namespace_version(namespace):
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), 1, None)
+        version = cache.get(_version_key(namespace), 1)
+    return version
+
+
+def invalidate(namespace):
+    try:
+        return cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.add(_version_key(namespace), 2, None)
+        return cache.get(_version_key(namespace), 2)
+
+
+def versioned_key(namespace, *parts):
+    return ":".join(str(part) for part in (namespace, namespace_version(namespace)) + parts)
+
+
+def anonymous_page_cache(view):
+    """Кэширует страницу целиком для анонимных GET-запросов.
+
+    Ключ - путь и параметры страницы в пространстве ``FEED``, поэтому любое
+    изменение постов, комментариев, групп и подписок сбрасывает все страницы.
+    Отдаёт ``ETag``/``Last-Modified`` и отвечает ``304`` на условный GET.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != "GET" or request.user.is_authenticated or not settings.PAGE_CACHE_TIMEOUT:
+            return view(request, *args, **kwargs)
+
+        key = versioned_key(FEED, "page", request.path, *(request.GET.get(param, "") for param in PAGE_PARAMS))
+        entry = cache.get(key)
+        if entry is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            etag = quote_etag(hashlib.md5(response.content).hexdigest())
+            entry = (response.content, response["Content-Type"], etag, int(time.time()))
+            cache.set(key, entry, settings.PAGE_CACHE_TIMEOUT)
+        content, content_type, etag, last_modified = entry
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(content, content_type=content_type)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_vary_headers(response, ("Cookie",))
+        return response
+    return wrapper
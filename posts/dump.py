@@ -0,0 +1,268 @@
+"""Выгрузка и загрузка пользователей, групп, постов, комментариев и подписок.
+
+Каждая запись - плоский словарь. Пользователи и группы связываются по
+уникальным ``username`` и ``slug``. У постов и комментариев естественного
+ключа нет (у автора может быть несколько постов с одной датой), поэтому
+они выгружаются с ключом ``(source, id)``: ``source`` - ``uid`` базы, где
+запись создана (``DumpSource``), ``id`` - её ``pk`` там. Загруженная запись
+хранит ключ в ``source`` и ``external_id`` и при следующей выгрузке отдаёт
+его же, а не свой ``pk``, поэтому ключ не зависит от того, через сколько
+баз прошла запись. По ключу пропускаются уже загруженные записи и
+находятся посты комментариев, в том числе при загрузке выгрузки обратно в
+ту же базу: её собственные записи ищутся по ``pk``. Ключи пачки
+разрешаются запросом на источник, и память не растёт с размером выгрузки.
+
+Форматы: JSON Lines (одна запись в строке, модель в поле ``model``) и CSV
+(каталог с файлом на модель). Модели идут в порядке ``MODELS``, чтобы
+ссылки указывали на уже загруженные строки.
+"""
+import csv
+import json
+import os
+from contextlib import contextmanager
+from itertools import groupby, islice
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from . import cache, search, timeline
+from .models import AuthorStats, Comment, DumpSource, Follow, Group, MediaBlob, Post, User
+
+MODELS = ("user", "group", "post", "comment", "follow")
+FIELDS = {
+    "user": ("username", "email", "first_name", "last_name", "password", "is_active", "is_staff", "is_superuser",
+             "date_joined"),
+    "group": ("slug", "title", "description"),
+    "post": ("source", "id", "author", "pub_date", "text", "group", "image"),
+    "comment": ("source", "id", "post_source", "post", "author", "created", "text"),
+    "follow": ("user", "author"),
+}
+
+
+def export_rows(model):
+    """Записи модели ``model`` по одной, без загрузки таблицы в память."""
+    if model == "user":
+        rows = User.objects.order_by("pk").values_list(*FIELDS["user"]).iterator()
+    elif model == "group":
+        rows = Group.objects.order_by("pk").values_list(*FIELDS["group"]).iterator()
+    elif model == "post":
+        local = DumpSource.objects.local().uid
+        rows = ((source or local, external_id or pk, *rest) for source, external_id, pk, *rest in
+                Post.objects.order_by("pk").values_list("source__uid", "external_id", "pk", "author__username",
+                                                        "pub_date", "text", "group__slug", "image").iterator())
+    elif model == "comment":
+        local = DumpSource.objects.local().uid
+        rows = ((source or local, external_id or pk, post_source or local, post_external_id or post_id, *rest)
+                for source, external_id, pk, post_source, post_external_id, post_id, *rest in
+                Comment.objects.order_by("pk").values_list("source__uid", "external_id", "pk", "post__source__uid",
+                                                           "post__external_id", "post_id", "author__username",
+                                                           "created", "text").iterator())
+    else:
+        rows = Follow.objects.order_by("pk").values_list("user__username", "author__username").iterator()
+    for row in rows:
+        yield dict(zip(FIELDS[model], (value.isoformat() if hasattr(value, "isoformat") else value
+                                       for value in row)))
+
+
+def write_jsonl(stream, models=MODELS):
+    written = 0
+    for model in models:
+        for record in export_rows(model):
+            stream.write(json.dumps({"model": model, **record}, ensure_ascii=False) + "\n")
+            written += 1
+    return written
+
+
+def write_csv(directory, models=MODELS):
+    os.makedirs(directory, exist_ok=True)
+    written = 0
+    for model in models:
+        with open(os.path.join(directory, f"{model}.csv"), "w", newline="", encoding="utf-8") as stream:
+            writer = csv.DictWriter(stream, FIELDS[model])
+            writer.writeheader()
+            for record in export_rows(model):
+                writer.writerow(record)
+                written += 1
+    return written
+
+
+def read_jsonl(stream):
+    """``(model, record)`` по строкам JSON Lines."""
+    for line in stream:
+        if line.strip():
+            record = json.loads(line)
+            yield record.pop("model"), record
+
+
+def read_csv(directory):
+    for model in MODELS:
+        path = os.path.join(directory, f"{model}.csv")
+        if not os.path.exists(path):
+            continue
+        with open(path, newline="", encoding="utf-8") as stream:
+            for record in csv.DictReader(stream):
+                yield model, {key: value if value != "" else None for key, value in record.items()}
+
+
+def batches(records, batch_size):
+    """Пачки записей одной модели: ``(model, [record, ...])``."""
+    for model, group in groupby(records, key=lambda item: item[0]):
+        group = (record for _, record in group)
+        while True:
+            batch = list(islice(group, batch_size))
+            if not batch:
+                break
+            yield model, batch
+
+
+def as_bool(value):
+    return value in (True, "True", "true", "1", 1)
+
+
+def as_datetime(value):
+    return parse_datetime(value) if isinstance(value, str) else value
+
+
+def as_int(value):
+    return int(value) if value not in (None, "") else None
+
+
+def user_ids(names):
+    return dict(User.objects.filter(username__in=set(names)).values_list("username", "pk"))
+
+
+@contextmanager
+def keep_dates():
+    """Отключает ``auto_now_add``, чтобы ``bulk_create`` сохранил даты из выгрузки."""
+    fields = [Post._meta.get_field("pub_date"), Comment._meta.get_field("created")]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def build_users(batch):
+    existing = set(User.objects.filter(username__in=[r["username"] for r in batch])
+                   .values_list("username", flat=True))
+    return [User(username=r["username"], email=r["email"] or "", first_name=r["first_name"] or "",
+                 last_name=r["last_name"] or "", password=r["password"] or "!", is_active=as_bool(r["is_active"]),
+                 is_staff=as_bool(r.get("is_staff")), is_superuser=as_bool(r.get("is_superuser")),
+                 date_joined=as_datetime(r["date_joined"]))
+            for r in batch if r["username"] not in existing]
+
+
+def build_groups(batch):
+    existing = set(Group.objects.filter(slug__in=[r["slug"] for r in batch]).values_list("slug", flat=True))
+    return [Group(slug=r["slug"], title=r["title"], description=r["description"] or "")
+            for r in batch if r["slug"] not in existing]
+
+
+def dump_sources(uids):
+    """``{uid: DumpSource}``; незнакомые источники заводятся."""
+    uids = set(uids)
+    sources = {source.uid: source for source in DumpSource.objects.filter(uid__in=uids)}
+    for uid in uids - sources.keys():
+        sources[uid], _ = DumpSource.objects.get_or_create(uid=uid)
+    return sources
+
+
+def loaded(model, keys):
+    """``({(source, id): pk}, {uid: DumpSource})`` для строк ``model`` с ключами ``keys``.
+
+    Строки самой этой базы (``DumpSource.local``) ищутся и по ``pk``.
+    """
+    sources = dump_sources(uid for uid, _ in keys)
+    found = {}
+    for uid, source in sources.items():
+        ids = {external_id for key_uid, external_id in keys if key_uid == uid}
+        rows = list(model.objects.filter(source=source, external_id__in=ids).values_list("external_id", "pk"))
+        if source.local:
+            rows += model.objects.filter(source=None, pk__in=ids).values_list("pk", "pk")
+        found.update(((uid, external_id), pk) for external_id, pk in rows)
+    return found, sources
+
+
+def build_posts(batch):
+    authors = user_ids(r["author"] for r in batch)
+    groups = dict(Group.objects.filter(slug__in={r["group"] for r in batch if r["group"]})
+                  .values_list("slug", "pk"))
+    keys = [(r["source"], as_int(r["id"])) for r in batch]
+    existing, sources = loaded(Post, keys)
+    posts = []
+    for record, key in zip(batch, keys):
+        author_id = authors.get(record["author"])
+        if author_id is None or key in existing:
+            continue
+        existing[key] = None
+        posts.append(Post(source=sources[key[0]], external_id=key[1], author_id=author_id,
+                          pub_date=as_datetime(record["pub_date"]), text=record["text"],
+                          group_id=groups.get(record["group"]), image=record["image"] or ""))
+    return posts
+
+
+def build_comments(batch):
+    authors = user_ids(r["author"] for r in batch)
+    post_keys = [(r["post_source"], as_int(r["post"])) for r in batch]
+    posts, _ = loaded(Post, post_keys)
+    keys = [(r["source"], as_int(r["id"])) for r in batch]
+    existing, sources = loaded(Comment, keys)
+    comments = []
+    for record, key, post_key in zip(batch, keys, post_keys):
+        post_id, author_id = posts.get(post_key), authors.get(record["author"])
+        if post_id is None or author_id is None or key in existing:
+            continue
+        existing[key] = None
+        comments.append(Comment(source=sources[key[0]], external_id=key[1], post_id=post_id, author_id=author_id,
+                                created=as_datetime(record["created"]), text=record["text"]))
+    return comments
+
+
+def build_follows(batch):
+    users = user_ids([r["user"] for r in batch] + [r["author"] for r in batch])
+    existing = set(Follow.objects.filter(user_id__in=users.values(), author_id__in=users.values())
+                   .values_list("user_id", "author_id"))
+    follows = []
+    for record in batch:
+        key = (users.get(record["user"]), users.get(record["author"]))
+        if None in key or key in existing:
+            continue
+        existing.add(key)
+        follows.append(Follow(user_id=key[0], author_id=key[1]))
+    return follows
+
+
+BUILDERS = {"user": (User, build_users), "group": (Group, build_groups), "post": (Post, build_posts),
+            "comment": (Comment, build_comments), "follow": (Follow, build_follows)}
+
+
+def load(records, batch_size=1000):
+    """Загружает записи пачками, каждая пачка в своей транзакции.
+
+    Возвращает ``{model: [создано, пропущено]}``. Сигналы при ``bulk_create``
+    не срабатывают, поэтому производные данные пересчитываются отдельно
+    (см. команду ``yatube_import``), а закэшированные страницы лент
+    сбрасываются здесь.
+    """
+    stats = {model: [0, 0] for model in MODELS}
+    with keep_dates():
+        for model, batch in batches(records, batch_size):
+            model_class, build = BUILDERS[model]
+            with transaction.atomic():
+                objects = build(batch)
+                model_class.objects.bulk_create(objects, ignore_conflicts=True)
+            stats[model][0] += len(objects)
+            stats[model][1] += len(batch) - len(objects)
+    cache.invalidate(cache.FEED)
+    return stats
+
+
+def rebuild_derived():
+    """Пересчитывает то, что при ``bulk_create`` не обновили сигналы."""
+    Post.objects.recount_comments()
+    AuthorStats.objects.reconcile()
+    MediaBlob.objects.reconcile()
+    search.rebuild()
+    timeline.rebuild()
@@ -16,12 +16,24 @@ class PostForm(ModelForm):
             "image": "Картинку тоже"
         }
 
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_errors = upload_errors or {}
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for field, message in self.upload_errors.items():
+            self.add_error(field, message)
+        return cleaned_data
+
     def edit(self):
         post = self.instance
         post.text = self.cleaned_data["text"]
         post.group = self.cleaned_data["group"]
         post.image = self.cleaned_data["image"]
-        post.save()
+        if "image" in self.changed_data:
+            post.thumbnails = post.image_variants = ""
+        post.save(update_fields=("text", "group", "image", "thumbnails", "image_variants"))
 
 
 class CommentForm(ModelForm):
@@ -0,0 +1,113 @@
+import argparse
+import json
+import math
+import time
+import tracemalloc
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post, User
+
+
+def percentile(values, share):
+    """Значение, ниже которого лежит доля ``share`` замеров (nearest rank)."""
+    values = sorted(values)
+    return values[max(math.ceil(share * len(values)), 1) - 1]
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"нужно целое число больше нуля, а не {value}")
+    return number
+
+
+class Command(BaseCommand):
+    help = ("Замеряет ленты тестовым клиентом: перцентили задержки, число и время SQL-запросов и "
+            "пиковую память для index, group_posts, profile, post_view и follow_index на разной "
+            "глубине страниц. Результат - JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=positive_int, default=20, metavar="N",
+                            help="запросов на каждую точку")
+        parser.add_argument("--pages", default="1,10,100", help="номера страниц для лент")
+        parser.add_argument("--anonymous", action="store_true",
+                            help="открывать ленты без входа (через кэш страниц), кроме follow_index")
+        parser.add_argument("--output", help="файл для JSON; по умолчанию stdout")
+
+    def handle(self, *args, **options):
+        reader = User.objects.annotate(total=Count("follower")).order_by("-total").first()
+        author = User.objects.annotate(total=Count("posts")).order_by("-total").first()
+        group = Group.objects.annotate(total=Count("posts")).order_by("-total").first()
+        if reader is None or author is None or not Post.objects.exists():
+            raise CommandError("В базе нет данных, сначала запустите generate_data")
+        post = Post.objects.filter(author=author).order_by("-pub_date").first()
+
+        member = Client()
+        member.force_login(reader)
+        client = Client() if options["anonymous"] else member
+        targets = [("index", client, reverse("index"), True),
+                   ("profile", client, reverse("profile", args=[author.username]), True),
+                   ("post_view", client, reverse("post", args=[author.username, post.pk]), False),
+                   ("follow_index", member, reverse("follow_index"), True)]
+        if group is not None:
+            targets.insert(1, ("group_posts", client, reverse("group_posts", args=[group.slug]), True))
+
+        pages = [int(page) for page in options["pages"].split(",")]
+        results = []
+        for name, view_client, url, paginated in targets:
+            for page in pages if paginated else [None]:
+                results.append({"view": name, "page": page,
+                                **self.measure(view_client, f"{url}?page={page}" if page else url,
+                                               options["requests"])})
+
+        report = {
+            "created": timezone.now().isoformat(),
+            "django": django.get_version(),
+            "anonymous": options["anonymous"],
+            "requests": options["requests"],
+            "dataset": {"users": User.objects.count(), "groups": Group.objects.count(),
+                        "posts": Post.objects.count(), "comments": Comment.objects.count(),
+                        "follows": Follow.objects.count()},
+            "results": results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as stream:
+                stream.write(output)
+        else:
+            self.stdout.write(output)
+
+    def measure(self, client, url, requests):
+        """Задержки меряются отдельно от запросов и памяти, чтобы учёт не искажал время."""
+        client.get(url)
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.get(url)
+            latencies.append((time.perf_counter() - start) * 1000)
+        with CaptureQueriesContext(connection) as queries:
+            tracemalloc.start()
+            try:
+                client.get(url)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        return {
+            "url": url,
+            "status": response.status_code,
+            "p50_ms": round(percentile(latencies, 0.5), 2),
+            "p90_ms": round(percentile(latencies, 0.9), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "max_ms": round(max(latencies), 2),
+            "queries": len(queries),
+            "sql_ms": round(sum(float(query["time"]) for query in queries.captured_queries) * 1000, 2),
+            "peak_memory_kb": round(peak / 1024, 1),
+        }
@@ -0,0 +1,49 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import get_thumbnail
+
+from posts.models import Post
+
+
+def pick_variant(variants, viewport, accept):
+    """Вариант, который выберет браузер: первый поддерживаемый формат, ширина не меньше экрана."""
+    for image_format in accept:
+        candidates = sorted((v for v in variants if v["format"] == image_format), key=lambda v: v["width"])
+        if candidates:
+            return next((v for v in candidates if v["width"] >= viewport), candidates[-1])
+    return None
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает объём картинок одной страницы главной ленты: одна JPEG-миниатюра "
+            "960x339 против вариантов из srcset для заданного экрана. Результат - JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--viewport", type=int, default=480, help="ширина экрана в пикселях с учётом DPR")
+        parser.add_argument("--accept", default="avif,webp,jpeg", help="форматы, которые понимает браузер")
+        parser.add_argument("--per-page", type=int, default=10)
+
+    def handle(self, *args, **options):
+        accept = options["accept"].split(",")
+        geometry, thumbnail_options = settings.THUMBNAIL_SIZES["card"]
+        posts = Post.objects.exclude(image="").exclude(image__isnull=True)[:options["per_page"]]
+
+        before = after = 0
+        for post in posts:
+            card = get_thumbnail(post.image, geometry, **thumbnail_options)
+            card_bytes = card.storage.size(card.name)
+            variant = pick_variant(json.loads(post.image_variants or "[]"), options["viewport"], accept)
+            before += card_bytes
+            after += variant["bytes"] if variant else card_bytes
+
+        report = {
+            "posts": len(posts),
+            "viewport": options["viewport"],
+            "accept": accept,
+            "before_bytes": before,
+            "after_bytes": after,
+            "saved_ratio": round(1 - after / before, 3) if before else 0,
+        }
+        self.stdout.write(json.dumps(report))
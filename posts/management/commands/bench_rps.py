@@ -0,0 +1,126 @@
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from .bench_feeds import percentile
+
+
+def procfile_command(process="web"):
+    """Команда процесса ``process`` из ``Procfile``."""
+    with open(os.path.join(settings.BASE_DIR, "Procfile")) as stream:
+        for line in stream:
+            name, _, command = line.partition(":")
+            if name.strip() == process:
+                return shlex.split(command)
+    raise CommandError(f"В Procfile нет процесса {process}")
+
+
+class Command(BaseCommand):
+    help = ("Запускает gunicorn из Procfile с CONN_MAX_AGE из --max-age по очереди и меряет запросы "
+            "в секунду к --url параллельными клиентами. Результат - JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="/", help="адрес для замера")
+        parser.add_argument("--max-age", default="0,60", help="значения DATABASE_CONN_MAX_AGE через запятую")
+        parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", 2)),
+                            help="воркеров gunicorn")
+        parser.add_argument("--concurrency", type=int, default=8, help="параллельных клиентов")
+        parser.add_argument("--duration", type=float, default=10, help="секунд на каждый замер")
+        parser.add_argument("--port", type=int, default=8765, help="порт gunicorn")
+        parser.add_argument("--page-cache", action="store_true",
+                            help="не отключать кэш страниц (тогда база почти не участвует)")
+        parser.add_argument("--output", help="файл для JSON; по умолчанию stdout")
+
+    def handle(self, *args, **options):
+        results = [self.run(int(max_age), options) for max_age in options["max_age"].split(",")]
+        report = {
+            "created": timezone.now().isoformat(),
+            "django": django.get_version(),
+            "command": " ".join(procfile_command()),
+            "workers": options["workers"],
+            "concurrency": options["concurrency"],
+            "duration": options["duration"],
+            "results": results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as stream:
+                stream.write(output)
+        else:
+            self.stdout.write(output)
+
+    def run(self, max_age, options):
+        address = f"127.0.0.1:{options['port']}"
+        env = dict(os.environ, DATABASE_CONN_MAX_AGE=str(max_age))
+        if not options["page_cache"]:
+            env["PAGE_CACHE_TIMEOUT"] = "0"
+        server = subprocess.Popen(procfile_command() + ["--bind", address, "--workers", str(options["workers"])],
+                                  cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+        try:
+            url = f"http://{address}{options['url']}"
+            self.wait_ready(url, server)
+            return {"conn_max_age": max_age, **self.measure(url, options["concurrency"], options["duration"])}
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    def wait_ready(self, url, server, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError("gunicorn завершился при запуске")
+            try:
+                urlopen(url, timeout=5).read()
+                return
+            except (URLError, ConnectionError):
+                time.sleep(0.2)
+        raise CommandError(f"gunicorn не ответил за {timeout} с")
+
+    def measure(self, url, concurrency, duration):
+        latencies = []
+        errors = []
+        # первый запрос каждого воркера открывает соединение при любом CONN_MAX_AGE
+        for _ in range(concurrency):
+            urlopen(url, timeout=30).read()
+        stop = time.monotonic() + duration
+
+        def client():
+            own = []
+            while time.monotonic() < stop:
+                start = time.perf_counter()
+                try:
+                    with urlopen(url, timeout=30) as response:
+                        response.read()
+                except (URLError, ConnectionError) as error:
+                    errors.append(str(error))
+                    continue
+                own.append((time.perf_counter() - start) * 1000)
+            latencies.extend(own)
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        if not latencies:
+            raise CommandError(f"Ни одного успешного ответа: {errors[:3]}")
+        return {
+            "requests": len(latencies),
+            "errors": len(errors),
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.5), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+        }
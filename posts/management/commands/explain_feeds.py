@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from posts import timeline
+from posts.models import Comment, Follow, Post, User
+from posts.paginator import FEED_KEYS, CursorPaginator
+
+PER_PAGE = 10
+
+
+def feed_queries():
+    """Запросы, которые выполняют ленты и страница поста, с подставными id.
+
+    Ветка ``follow_index`` для авторов с fan-out on read не проверяется:
+    она сортирует посты при чтении намеренно.
+    """
+    user = User(pk=1)
+    cursor = (timezone.now(), 1)
+    feeds = {
+        "index": (Post.objects.for_feed(), FEED_KEYS),
+        "group_posts": (Post.objects.for_feed().filter(group_id=1), FEED_KEYS),
+        "profile": (Post.objects.for_feed().filter(author_id=1), FEED_KEYS),
+        "follow_index": timeline.follow_feed(user),
+    }
+    for name, (queryset, keys) in feeds.items():
+        paginator = CursorPaginator(queryset, PER_PAGE, keys=keys)
+        yield name, paginator.window()
+        yield f"{name} (after)", paginator.window(after=cursor)
+        yield f"{name} (before)", paginator.window(before=cursor)
+    yield "post", (Post.objects.select_related("author__stats", "group")
+                   .filter(author__username="user", id=1).order_by())
+    yield "post (comments)", Comment.objects.filter(post_id=1).select_related("author").order_by("created")
+    yield "profile (is_following)", Follow.objects.filter(user_id=1, author_id=1)
+
+
+def plan_problems(plan):
+    for line in plan.splitlines():
+        detail = line.split(" ", 3)[-1]
+        if detail.startswith("SCAN") and "USING" not in detail:
+            yield detail
+        if "TEMP B-TREE" in detail:
+            yield detail
+
+
+class Command(BaseCommand):
+    help = ("Выполняет EXPLAIN QUERY PLAN для запросов лент и завершается с ошибкой, "
+            "если где-то нужен полный просмотр таблицы или сортировка во временном B-дереве")
+
+    def handle(self, *args, **options):
+        failed = []
+        for name, queryset in feed_queries():
+            plan = queryset.explain()
+            problems = list(plan_problems(plan))
+            style = self.style.ERROR if problems else self.style.SUCCESS
+            self.stdout.write(style(name))
+            self.stdout.write(plan)
+            if problems:
+                failed.append(f"{name}: {'; '.join(problems)}")
+        if failed:
+            raise CommandError("Неудачные планы запросов:\n" + "\n".join(failed))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.template.defaultfilters import filesizeformat
+
+from posts import media_gc
+
+
+class Command(BaseCommand):
+    help = "Удаляет картинки, варианты и миниатюры, на которые не ссылается ни один пост"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="только показать, что будет удалено")
+        parser.add_argument("--min-age", type=int, default=3600,
+                            help="не трогать файлы моложе этого числа секунд")
+        parser.add_argument("--batch-size", type=int, default=500, help="файлов в одной пачке")
+        parser.add_argument("--incremental", action="store_true",
+                            help="обойти только --dirs каталогов, продолжив с прошлого места")
+        parser.add_argument("--dirs", type=int, default=16, help="каталогов за инкрементальный проход")
+        parser.add_argument("--interval", type=int, default=0,
+                            help="повторять инкрементальные проходы с этой паузой в секундах")
+
+    def handle(self, *args, **options):
+        while True:
+            collector = media_gc.Collector(dry_run=options["dry_run"], min_age=options["min_age"],
+                                           batch_size=options["batch_size"])
+            dirs = media_gc.directories()
+            if options["incremental"] or options["interval"]:
+                dirs = self.next_slice(dirs, options["dirs"])
+            collector.collect(dirs)
+            self.report(collector, options["dry_run"])
+            if not options["interval"]:
+                return
+            close_old_connections()
+            time.sleep(options["interval"])
+
+    def next_slice(self, dirs, count):
+        if not dirs:
+            return []
+        start = media_gc.read_position() % len(dirs)
+        media_gc.save_position((start + count) % len(dirs))
+        return (dirs[start:] + dirs[:start])[:count]
+
+    def report(self, collector, dry_run):
+        verb = "Можно удалить" if dry_run else "Удалено"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} файлов: {collector.files}, {filesizeformat(collector.bytes)} ({collector.bytes} байт)"))
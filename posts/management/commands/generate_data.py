@@ -0,0 +1,99 @@
+import random
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from posts import dump
+from posts.models import Comment, Follow, Group, Post, User
+
+WORDS = ("котик", "закат", "море", "город", "книга", "кофе", "поезд", "горы", "дождь", "музыка", "сад",
+         "утро", "друзья", "снег", "лес", "работа", "кино", "велосипед", "осень", "дом")
+
+
+class Command(BaseCommand):
+    help = ("Заполняет базу синтетическими данными для нагрузочных замеров: пользователи, группы, посты, "
+            "комментарии и подписки с перекосом популярности (например, --users 100000 --posts 5000000)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=20000)
+        parser.add_argument("--comments", type=float, default=0.5, help="комментариев в среднем на пост")
+        parser.add_argument("--follows", type=int, default=20, help="подписок в среднем на пользователя")
+        parser.add_argument("--skew", type=float, default=3.0,
+                            help="перекос популярности авторов: 1 - равномерно, больше - сильнее")
+        parser.add_argument("--days", type=int, default=365, help="за сколько дней распределить посты")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--skip-derived", action="store_true",
+                            help="не пересчитывать счётчики, ленты и поисковый индекс")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.skew = options["skew"]
+        self.batch_size = options["batch_size"]
+        start = (User.objects.aggregate(top=Max("pk"))["top"] or 0) + 1
+
+        self.insert(User, (User(username=f"bench{start + i}", password="!") for i in range(options["users"])))
+        user_ids = list(User.objects.filter(username__startswith="bench").order_by("pk")
+                        .values_list("pk", flat=True))
+        # кто много пишет, не обязательно популярен: иначе почти все посты достаются
+        # авторам с тысячами подписчиков и лента подписок раздувается
+        writers = self.rng.sample(user_ids, len(user_ids))
+        self.insert(Group, (Group(title=f"Группа {start + i}", slug=f"bench-{start + i}", description="")
+                            for i in range(options["groups"])))
+        group_ids = list(Group.objects.filter(slug__startswith="bench-").values_list("pk", flat=True))
+
+        first_post = (Post.objects.aggregate(top=Max("pk"))["top"] or 0) + 1
+        with dump.keep_dates():
+            self.insert(Post, self.posts(options["posts"], options["days"], writers, group_ids))
+            last_post = Post.objects.aggregate(top=Max("pk"))["top"] or 0
+            comments = int(options["posts"] * options["comments"])
+            if last_post >= first_post:
+                now = timezone.now()
+                self.insert(Comment, (Comment(post_id=self.rng.randint(first_post, last_post),
+                                              author_id=self.rng.choice(user_ids), text=self.text(),
+                                              created=now - timedelta(seconds=comments - i))
+                                      for i in range(comments)))
+        self.insert(Follow, self.follows(user_ids, options["follows"]))
+
+        if not options["skip_derived"]:
+            dump.rebuild_derived()
+        self.stdout.write(self.style.SUCCESS(
+            f"Пользователей: {User.objects.count()}, постов: {Post.objects.count()}, "
+            f"комментариев: {Comment.objects.count()}, подписок: {Follow.objects.count()}"))
+
+    def insert(self, model, objects):
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                return
+            with transaction.atomic():
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def popular(self, ids):
+        """Случайный элемент ``ids``; первые выпадают чаще, насколько велик ``skew``."""
+        return ids[int(len(ids) * self.rng.random() ** self.skew)]
+
+    def text(self):
+        return " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(3, 30)))
+
+    def posts(self, count, days, user_ids, group_ids):
+        now = timezone.now()
+        step = timedelta(days=days) / max(count, 1)
+        for i in range(count):
+            group_id = self.rng.choice(group_ids) if group_ids and self.rng.random() < 0.5 else None
+            yield Post(author_id=self.popular(user_ids), group_id=group_id, text=self.text(),
+                       pub_date=now - step * (count - i))
+
+    def follows(self, user_ids, average):
+        for user_id in user_ids:
+            authors = {self.popular(user_ids) for _ in range(self.rng.randint(0, 2 * average))}
+            authors.discard(user_id)
+            for author_id in authors:
+                yield Follow(user_id=user_id, author_id=author_id)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import timeline
+from posts.models import TimelineEntry, User
+
+
+class Command(BaseCommand):
+    help = ("Заново раскладывает посты по лентам подписок. С --pending или --author раскладывает только "
+            "посты авторов, опустившихся ниже TIMELINE_FANOUT_LIMIT (для запуска по cron)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pending", action="store_true",
+                            help="разложить неразложенные посты всех авторов ниже порога")
+        parser.add_argument("--author", action="append", default=[], metavar="USERNAME",
+                            help="то же для одного автора; можно указать несколько раз")
+
+    def handle(self, *args, **options):
+        if options["pending"] or options["author"]:
+            author_ids = None
+            if options["author"]:
+                author_ids = list(User.objects.filter(username__in=options["author"]).values_list("pk", flat=True))
+                if len(author_ids) != len(set(options["author"])):
+                    raise CommandError(f"Нет таких пользователей среди {', '.join(options['author'])}")
+            done = timeline.backfill_pending(author_ids)
+            self.stdout.write(self.style.SUCCESS(f"Разложены посты авторов: {done}"))
+            return
+        timeline.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Записей в лентах: {TimelineEntry.objects.count()}"))
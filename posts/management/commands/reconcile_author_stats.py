@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import AuthorStats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики подписчиков, подписок и записей авторов"
+
+    def handle(self, *args, **options):
+        updated = AuthorStats.objects.reconcile()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано авторов: {updated}"))
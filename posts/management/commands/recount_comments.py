@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает сохранённое число комментариев у постов"
+
+    def handle(self, *args, **options):
+        updated = Post.objects.recount_comments()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано постов: {updated}"))
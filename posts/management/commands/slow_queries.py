@@ -0,0 +1,44 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from yatube import slow_queries
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Сводка журнала медленных запросов: самые тяжёлые формы запросов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--log", default=settings.SLOW_QUERY_LOG, help="файл журнала")
+        parser.add_argument("--top", type=int, default=10, help="сколько форм запросов показать")
+        parser.add_argument("--view", help="только запросы этого view")
+        parser.add_argument("--user", type=int, help="только запросы этого пользователя (id)")
+
+    def handle(self, *args, **options):
+        shapes = defaultdict(list)
+        for entry in slow_queries.read(options["log"]):
+            if options["view"] and entry.get("view") != options["view"]:
+                continue
+            if options["user"] is not None and entry.get("user_id") != options["user"]:
+                continue
+            shapes[entry["shape"]].append(entry)
+        total = sum(len(entries) for entries in shapes.values())
+        self.stdout.write(f"Медленных запросов: {total}, форм: {len(shapes)}")
+        worst = sorted(shapes.values(), key=lambda entries: -sum(e["duration_ms"] for e in entries))
+        for place, entries in enumerate(worst[:options["top"]], 1):
+            durations = [entry["duration_ms"] for entry in entries]
+            views = ", ".join(sorted({entry["view"] or "-" for entry in entries}))
+            self.stdout.write(self.style.WARNING(
+                f"{place}. {len(entries)} раз, всего {sum(durations):.1f} мс, p95 {percentile(durations, 0.95):.1f} мс,"
+                f" макс {max(durations):.1f} мс; {views}"))
+            self.stdout.write(f"   {entries[0]['shape'][:300]}")
+            latest = entries[-1]
+            self.stdout.write(f"   план: {'; '.join(latest['plan']) or '-'}")
+            if latest["stack"]:
+                self.stdout.write(f"   откуда: {latest['stack'][-1]}")
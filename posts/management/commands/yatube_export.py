@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts import dump
+
+
+class Command(BaseCommand):
+    help = ("Выгружает пользователей, группы, посты, комментарии и подписки в JSON Lines "
+            "(файл или stdout) или в CSV (каталог с файлом на модель)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="-", help="файл .jsonl, каталог для CSV или - для stdout")
+        parser.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+        parser.add_argument("--models", default=",".join(dump.MODELS), help="какие модели выгрузить")
+
+    def handle(self, *args, **options):
+        models = [model for model in dump.MODELS if model in options["models"].split(",")]
+        if options["format"] == "csv":
+            written = dump.write_csv(options["path"], models)
+        elif options["path"] == "-":
+            written = dump.write_jsonl(self.stdout, models)
+        else:
+            with open(options["path"], "w", encoding="utf-8") as stream:
+                written = dump.write_jsonl(stream, models)
+        self.stderr.write(f"Выгружено записей: {written}")
@@ -0,0 +1,36 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import dump
+
+
+class Command(BaseCommand):
+    help = ("Загружает выгрузку yatube_export пачками через bulk_create; уже существующие "
+            "записи пропускаются, связи разрешаются по username, slug и ключу (источник, id) постов")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="файл .jsonl, каталог с CSV или - для stdin")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--skip-derived", action="store_true",
+                            help="не пересчитывать счётчики, ленты и поисковый индекс после загрузки")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if path == "-":
+            stats = dump.load(dump.read_jsonl(sys.stdin), options["batch_size"])
+        elif os.path.isdir(path):
+            stats = dump.load(dump.read_csv(path), options["batch_size"])
+        elif os.path.exists(path):
+            with open(path, encoding="utf-8") as stream:
+                stats = dump.load(dump.read_jsonl(stream), options["batch_size"])
+        else:
+            raise CommandError(f"Нет такого файла или каталога: {path}")
+
+        for model, (created, skipped) in stats.items():
+            self.stdout.write(f"{model}: создано {created}, пропущено {skipped}")
+        if options["skip_derived"]:
+            return
+        dump.rebuild_derived()
+        self.stdout.write(self.style.SUCCESS("Счётчики, ленты и поисковый индекс пересчитаны"))
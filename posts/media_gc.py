@@ -0,0 +1,152 @@
+"""Поиск и удаление файлов медиа, на которые не ссылается ни один пост.
+
+Проверяются три вида файлов:
+
+* оригиналы картинок в ``posts/`` - живые, если имя есть в ``Post.image``;
+* варианты для ``srcset`` в ``posts/variants/`` - живые, если их адрес
+  есть в ``Post.image_variants``;
+* миниатюры sorl в ``THUMBNAIL_PREFIX`` - живые, если их адрес есть в
+  ``Post.thumbnails``; у удалённых чистится и запись в kvstore sorl.
+
+Каталоги обходятся через ``os.scandir`` пачками по ``batch_size`` файлов,
+оригиналы проверяются одним запросом на пачку. Файлы моложе ``min_age``
+секунд не трогаются: они могли быть только что загружены, а пост ещё не
+сохранён.
+
+Место, с которого продолжит следующий инкрементальный проход, хранится в
+файле ``POSITION_FILE`` в ``MEDIA_ROOT`` (вне обходимых каталогов), чтобы
+его видели запуски из cron в разных процессах.
+"""
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from sorl.thumbnail import default as sorl
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .models import MediaBlob, Post
+
+ORIGINALS = "posts"
+VARIANTS = "posts/variants"
+POSITION_FILE = ".gc_media_position"
+
+
+def media_path(name):
+    return os.path.join(settings.MEDIA_ROOT, name)
+
+
+def directories():
+    """Все каталоги, которые обходит сборщик, в стабильном порядке."""
+    found = []
+    pending = [ORIGINALS, sorl_settings.THUMBNAIL_PREFIX.strip("/")]
+    while pending:
+        directory = pending.pop()
+        if not os.path.isdir(media_path(directory)):
+            continue
+        found.append(directory)
+        with os.scandir(media_path(directory)) as entries:
+            pending.extend(f"{directory}/{entry.name}" for entry in entries if entry.is_dir(follow_symlinks=False))
+    return sorted(found)
+
+
+def read_position():
+    """Номер каталога, с которого продолжит инкрементальный проход."""
+    try:
+        with open(media_path(POSITION_FILE)) as stream:
+            return int(stream.read())
+    except (OSError, ValueError):
+        return 0
+
+
+def save_position(position):
+    path = media_path(POSITION_FILE)
+    os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as stream:
+        stream.write(str(position))
+    os.replace(temporary, path)
+
+
+def scan(directory, batch_size):
+    """Файлы каталога пачками: ``[(имя относительно MEDIA_ROOT, размер, mtime)]``."""
+    with os.scandir(media_path(directory)) as entries:
+        files = (entry for entry in entries if entry.is_file(follow_symlinks=False))
+        while True:
+            batch = [(f"{directory}/{entry.name}", *stat_of(entry)) for entry in islice(files, batch_size)]
+            if not batch:
+                return
+            yield batch
+
+
+def stat_of(entry):
+    stat = entry.stat(follow_symlinks=False)
+    return stat.st_size, stat.st_mtime
+
+
+def url_to_name(url):
+    if url.startswith(settings.MEDIA_URL):
+        return url[len(settings.MEDIA_URL):]
+    return url
+
+
+class Collector:
+    def __init__(self, dry_run=False, min_age=3600, batch_size=500):
+        self.dry_run = dry_run
+        self.min_age = min_age
+        self.batch_size = batch_size
+        self.files = 0
+        self.bytes = 0
+        self._live_derived = None
+
+    def live_derived(self):
+        """Имена живых вариантов и миниатюр; считаются один раз на запуск."""
+        if self._live_derived is None:
+            names = set()
+            rows = (Post.objects.exclude(thumbnails="").order_by()
+                    .values_list("thumbnails", "image_variants").distinct())
+            for thumbnails, variants in rows.iterator():
+                names.update(url_to_name(url) for url in json.loads(thumbnails).values())
+                names.update(url_to_name(variant["url"]) for variant in json.loads(variants or "[]"))
+            self._live_derived = names
+        return self._live_derived
+
+    def orphans(self, directory, batch):
+        names = [name for name, _, _ in batch]
+        if directory == VARIANTS or not directory.startswith(ORIGINALS):
+            live = self.live_derived()
+        else:
+            live = set(Post.objects.filter(image__in=names).values_list("image", flat=True))
+        return [name for name in names if name not in live]
+
+    def collect(self, dirs):
+        deadline = time.time() - self.min_age
+        for directory in dirs:
+            if not os.path.isdir(media_path(directory)):
+                continue
+            for batch in scan(directory, self.batch_size):
+                batch = [row for row in batch if row[2] < deadline]
+                sizes = {name: size for name, size, _ in batch}
+                orphans = self.orphans(directory, batch)
+                if not self.dry_run:
+                    self.remove(directory, orphans)
+                self.files += len(orphans)
+                self.bytes += sum(sizes[name] for name in orphans)
+        return self
+
+    def remove(self, directory, names):
+        if not names:
+            return
+        if directory.startswith(ORIGINALS):
+            for name in names:
+                default_storage.delete(name)
+            if directory != VARIANTS:
+                MediaBlob.objects.filter(name__in=names).delete()
+        else:
+            for name in names:
+                thumbnail = ImageFile(name, sorl.storage)
+                sorl.kvstore.delete(thumbnail)
+                thumbnail.delete()
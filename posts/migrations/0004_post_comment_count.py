@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def recount_comments(apps, schema_editor):
+    Comment = apps.get_model("posts", "Comment")
+    Post = apps.get_model("posts", "Post")
+    counts = Comment.objects.filter(post=OuterRef("pk")).order_by().values("post").annotate(total=Count("pk"))
+    Post.objects.update(comment_count=Coalesce(Subquery(counts.values("total"),
+                                                        output_field=models.IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_post_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(recount_comments, migrations.RunPython.noop),
+    ]
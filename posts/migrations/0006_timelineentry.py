@@ -0,0 +1,48 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_timelines(apps, schema_editor):
+    """Раскладывает посты по лентам уже существующих подписок, кроме авторов с fan-out on read."""
+    Follow = apps.get_model("posts", "Follow")
+    Post = apps.get_model("posts", "Post")
+    TimelineEntry = apps.get_model("posts", "TimelineEntry")
+    heavy = (Follow.objects.values("author").annotate(total=Count("pk"))
+             .filter(total__gte=settings.TIMELINE_FANOUT_LIMIT).values("author"))
+    for user_id, author_id in list(Follow.objects.exclude(author__in=heavy).values_list("user_id", "author_id")):
+        posts = Post.objects.filter(author_id=author_id).values_list("pk", "pub_date")
+        TimelineEntry.objects.bulk_create([TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                                           for pk, pub_date in posts], batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0005_authorstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date'], name='timeline_user_pub_date'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together={('user', 'post')},
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_mediablob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='external_id',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='external_id',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
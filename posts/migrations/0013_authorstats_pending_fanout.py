@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_external_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='pending_fanout',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
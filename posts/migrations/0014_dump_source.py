@@ -0,0 +1,57 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def forget_unscoped_ids(apps, schema_editor):
+    """Загруженные раньше ``external_id`` без источника не отличить от pk других баз."""
+    for name in ("Post", "Comment"):
+        apps.get_model("posts", name).objects.exclude(external_id=None).update(external_id=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_authorstats_pending_fanout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DumpSource',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uid', models.CharField(max_length=32, unique=True)),
+                ('local', models.BooleanField(null=True, unique=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='external_id',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='external_id',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='source',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='posts.DumpSource'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='source',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='posts.DumpSource'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='comment',
+            unique_together={('source', 'external_id')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='post',
+            unique_together={('source', 'external_id')},
+        ),
+        migrations.RunPython(forget_unscoped_ids, migrations.RunPython.noop),
+    ]
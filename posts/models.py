@@ -1,8 +1,19 @@
+import json
+from uuid import uuid4
+
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
+# заглушка на месте картинки, пока миниатюра готовится в фоне
+THUMBNAIL_PLACEHOLDER = ("data:image/svg+xml;charset=utf-8,%3Csvg xmlns='http://www.w3.org/2000/svg' "
+                         "width='960' height='339'%3E%3Crect width='100%25' height='100%25' fill='%23e9ecef'/%3E%3C/svg%3E")
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
@@ -13,6 +24,61 @@ class Group(models.Model):
         return self.title
 
 
+def count_subquery(model, field, outer="pk"):
+    """Подзапрос ``COUNT(*)`` строк ``model``, у которых ``field`` равно ``outer``."""
+    rows = (model.objects.filter(**{field: OuterRef(outer)})
+            .order_by().values(field).annotate(total=Count("pk")).values("total"))
+    return Coalesce(Subquery(rows, output_field=models.IntegerField()), 0)
+
+
+def batched_by_pk(queryset, size=1000):
+    """Объекты ``queryset`` пачками по возрастанию ``pk``.
+
+    В отличие от ``iterator()`` курсор не остаётся открытым между пачками:
+    на SQLite открытый курсор держит снимок чтения, и пока в ту же базу
+    идёт запись, WAL не может сброситься и растёт без ограничений.
+    """
+    last = None
+    while True:
+        page = queryset.order_by("pk")
+        if last is not None:
+            page = page.filter(pk__gt=last)
+        batch = list(page[:size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1].pk
+
+
+class DumpSourceQuerySet(models.QuerySet):
+    def local(self):
+        """Источник для выгрузок этой базы; заводится при первой выгрузке."""
+        source, _ = self.get_or_create(local=True, defaults={"uid": uuid4().hex})
+        return source
+
+
+class DumpSource(models.Model):
+    """База, из выгрузки которой загружены посты и комментарии (см. ``posts.dump``)."""
+    uid = models.CharField(max_length=32, unique=True)
+    # True у единственной строки - самой этой базы, у остальных NULL
+    local = models.BooleanField(null=True, unique=True)
+
+    objects = DumpSourceQuerySet.as_manager()
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        return self.select_related("author", "group")
+
+    def recount_comments(self):
+        """Пересчитывает ``comment_count`` одним UPDATE по подзапросу."""
+        return self.update(comment_count=count_subquery(Comment, "post"))
+
+    def bump_card_version(self):
+        """Сбрасывает закэшированные карточки постов (см. ``post_card.html``)."""
+        return self.update(card_version=models.F("card_version") + 1)
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField("date published",
@@ -25,10 +91,41 @@ class Post(models.Model):
                               on_delete=models.SET_NULL,
                               related_name="posts",
                               blank=True, null=True)
-    image = models.ImageField(upload_to="posts/", blank=True, null=True)
+    image = models.ImageField(upload_to="posts/", storage=ContentAddressedStorage(), blank=True, null=True)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    card_version = models.PositiveIntegerField(default=0, editable=False)
+    # адреса готовых миниатюр по имени размера из THUMBNAIL_SIZES, JSON
+    thumbnails = models.TextField(blank=True, default="", editable=False)
+    # варианты картинки разной ширины и формата: [{"format", "width", "height", "bytes", "url"}], JSON
+    image_variants = models.TextField(blank=True, default="", editable=False)
+    # откуда пост загружен и его pk там (см. ``posts.dump``)
+    source = models.ForeignKey(DumpSource, on_delete=models.PROTECT, related_name="+",
+                               blank=True, null=True, editable=False)
+    external_id = models.PositiveIntegerField(blank=True, null=True, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
-        ordering = ("-pub_date",)
+        ordering = ("-pub_date", "-id")
+        unique_together = ("source", "external_id")
+        indexes = [
+            models.Index(fields=("group", "pub_date"), name="post_group_pub_date"),
+            models.Index(fields=("author", "pub_date"), name="post_author_pub_date"),
+            models.Index(fields=("image",), name="post_image"),
+        ]
+
+    @property
+    def card_thumbnail(self):
+        return json.loads(self.thumbnails or "{}").get("card", THUMBNAIL_PLACEHOLDER)
+
+    @property
+    def image_sources(self):
+        """``[{"type", "srcset"}]`` по форматам вариантов, от самого компактного."""
+        srcsets = {}
+        for variant in json.loads(self.image_variants or "[]"):
+            srcsets.setdefault(variant["format"], []).append(f"{variant['url']} {variant['width']}w")
+        return [{"type": f"image/{image_format}", "srcset": ", ".join(srcset)}
+                for image_format, srcset in srcsets.items()]
 
 
 class Comment(models.Model):
@@ -36,6 +133,13 @@ class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="comments")
     text = models.TextField(max_length=200)
     created = models.DateTimeField(auto_now_add=True)
+    source = models.ForeignKey(DumpSource, on_delete=models.PROTECT, related_name="+",
+                               blank=True, null=True, editable=False)
+    external_id = models.PositiveIntegerField(blank=True, null=True, editable=False)
+
+    class Meta:
+        unique_together = ("source", "external_id")
+        indexes = [models.Index(fields=("post", "created"), name="comment_post_created")]
 
     def __str__(self):
         return self.text
@@ -47,3 +151,99 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ("user", "author")
+        indexes = [models.Index(fields=("author", "user"), name="follow_author_user")]
+
+
+class AuthorStatsQuerySet(models.QuerySet):
+    def for_author(self, author):
+        """Счётчики автора; если строки ещё нет, она создаётся по реальным данным."""
+        try:
+            return author.stats
+        except AuthorStats.DoesNotExist:
+            stats, _ = self.get_or_create(author=author, defaults={
+                "follower_count": Follow.objects.filter(author=author).count(),
+                "following_count": Follow.objects.filter(user=author).count(),
+                "post_count": Post.objects.filter(author=author).count(),
+            })
+            author.stats = stats
+            return stats
+
+    def bump(self, author_id, **deltas):
+        """Сдвигает счётчики автора на ``deltas`` одним UPDATE.
+
+        Строки, которых ещё нет, не создаются: ``for_author`` заведёт их
+        при первом чтении уже с актуальными значениями.
+        """
+        rows = self.filter(author_id=author_id)
+        for field, delta in deltas.items():
+            if delta < 0:
+                rows = rows.filter(**{f"{field}__gte": -delta})
+        return rows.update(**{field: models.F(field) + delta for field, delta in deltas.items()})
+
+    def reconcile(self):
+        """Создаёт недостающие строки и пересчитывает все счётчики."""
+        missing = User.objects.filter(stats__isnull=True).values_list("pk", flat=True)
+        self.bulk_create([AuthorStats(author_id=pk) for pk in missing.iterator()],
+                         batch_size=500, ignore_conflicts=True)
+        return self.update(
+            follower_count=count_subquery(Follow, "author", "author_id"),
+            following_count=count_subquery(Follow, "user", "author_id"),
+            post_count=count_subquery(Post, "author", "author_id"),
+        )
+
+
+class AuthorStats(models.Model):
+    author = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0)
+    # постов, опубликованных без fan-out on write и ещё не разложенных по лентам (см. ``posts.timeline``)
+    pending_fanout = models.PositiveIntegerField(default=0)
+
+    objects = AuthorStatsQuerySet.as_manager()
+
+
+class TimelineEntry(models.Model):
+    """Пост в ленте подписок пользователя, разложенный при публикации."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("user", "post")
+        indexes = [models.Index(fields=("user", "pub_date", "post"), name="timeline_user_pub_date")]
+
+
+class MediaBlobQuerySet(models.QuerySet):
+    def acquire(self, name):
+        """Добавляет ссылку на файл ``name``."""
+        blob, created = self.get_or_create(name=name, defaults={"refcount": 1})
+        if not created:
+            self.filter(name=name).update(refcount=models.F("refcount") + 1)
+        return blob
+
+    def release(self, name):
+        """Снимает ссылку на файл; ``True``, если ссылок больше не осталось.
+
+        Файлы без строки (загруженные до появления счётчиков) не трогаются.
+        """
+        self.filter(name=name, refcount__gt=0).update(refcount=models.F("refcount") - 1)
+        deleted, _ = self.filter(name=name, refcount=0).delete()
+        return bool(deleted)
+
+    def reconcile(self):
+        """Пересчитывает ссылки по ``Post.image``; лишние строки удаляются."""
+        counts = (Post.objects.exclude(image="").exclude(image__isnull=True)
+                  .order_by().values_list("image").annotate(total=Count("pk")))
+        self.bulk_create([MediaBlob(name=name, refcount=total) for name, total in counts.iterator()],
+                         batch_size=500, ignore_conflicts=True)
+        self.exclude(name__in=Post.objects.filter(image__isnull=False).values("image")).delete()
+        return self.update(refcount=count_subquery(Post, "image", "name"))
+
+
+class MediaBlob(models.Model):
+    """Файл картинки из ``ContentAddressedStorage`` и число постов, которые на него ссылаются."""
+    name = models.CharField(max_length=100, primary_key=True)
+    refcount = models.PositiveIntegerField(default=0)
+
+    objects = MediaBlobQuerySet.as_manager()
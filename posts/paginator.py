@@ -0,0 +1,168 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+CURSOR_PARAMS = ("after", "before")
+FEED_KEYS = ("pub_date", "id")
+
+
+def encode_cursor(post):
+    value = f"{post.pub_date.isoformat()}|{post.pk}"
+    return urlsafe_base64_encode(force_bytes(value))
+
+
+def decode_cursor(cursor):
+    try:
+        pub_date, pk = force_str(urlsafe_base64_decode(cursor)).split("|")
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPage:
+    """Страница ленты, выбранная по ключу (pub_date, id) без OFFSET."""
+
+    def __init__(self, object_list, number, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f"<CursorPage {self.number}>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return max(self.number - 1, 1)
+
+    @property
+    def next_cursor(self):
+        if self.has_next() and self.object_list:
+            return encode_cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous() and self.object_list:
+            return encode_cursor(self.object_list[0])
+        return None
+
+
+class CursorPaginator:
+    """Постраничный вывод ленты по курсору.
+
+    Использует индекс по ``pub_date`` и дочитывает одну лишнюю запись,
+    чтобы узнать, есть ли следующая страница. ``COUNT(*)`` выполняется
+    только если ``count=True`` и шаблон обратился к ``count``/``page_range``.
+    ``keys`` - поля, по которым идёт сортировка; их значения должны совпадать
+    с ``pub_date`` и ``id`` поста.
+    """
+
+    def __init__(self, object_list, per_page, count=True, keys=FEED_KEYS):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.with_count = count
+        self.keys = keys
+        self.ordering = tuple(f"-{key}" for key in keys)
+
+    @property
+    def count(self):
+        if not self.with_count:
+            return None
+        if not hasattr(self, "_count"):
+            self._count = self.object_list.count()
+        return self._count
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(1, -(-self.count // self.per_page))
+
+    @property
+    def page_range(self):
+        if self.num_pages is None:
+            return range(0)
+        return range(1, self.num_pages + 1)
+
+    def window(self, after=None, before=None):
+        """Запрос за записями страницы (на одну больше ``per_page``).
+
+        Для ``before`` записи идут в обратном порядке, от старых к новым.
+        """
+        date_key, id_key = self.keys
+        queryset = self.object_list.order_by(*self.ordering)
+        if before is not None:
+            pub_date, pk = before
+            queryset = queryset.filter(Q(**{f"{date_key}__gt": pub_date})
+                                       | Q(**{date_key: pub_date, f"{id_key}__gt": pk})).order_by(*self.keys)
+        elif after is not None:
+            pub_date, pk = after
+            queryset = queryset.filter(Q(**{f"{date_key}__lt": pub_date})
+                                       | Q(**{date_key: pub_date, f"{id_key}__lt": pk}))
+        return queryset[:self.per_page + 1]
+
+    def page(self, after=None, before=None, number=1):
+        rows = list(self.window(after=after, before=before))
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if before is not None:
+            return CursorPage(rows[::-1], number, self, has_next=True, has_previous=has_more)
+        return CursorPage(rows, number, self, has_next=has_more, has_previous=after is not None)
+
+    def get_page(self, query):
+        try:
+            number = max(int(query.get("page", 1)), 1)
+        except (TypeError, ValueError):
+            number = 1
+        after = decode_cursor(query.get("after", ""))
+        before = decode_cursor(query.get("before", ""))
+        if before is not None and number == 1:
+            return self.page(number=1)
+        return self.page(after=after, before=before, number=number)
+
+
+def paginate(request, object_list, per_page, keys=FEED_KEYS):
+    """Возвращает ``(page, paginator)`` для ленты постов.
+
+    Без курсора в запросе работает обычный ``Paginator`` с номерами
+    страниц; ссылки «Предыдущая/Следующая» ведут уже на курсорные страницы.
+    """
+    if any(request.GET.get(param) for param in CURSOR_PARAMS):
+        paginator = CursorPaginator(object_list, per_page,
+                                    count=settings.POSTS_PAGINATOR_COUNT, keys=keys)
+        return paginator.get_page(request.GET), paginator
+
+    paginator = Paginator(object_list.order_by(*(f"-{key}" for key in keys)), per_page)
+    page = paginator.get_page(request.GET.get("page"))
+    page.next_cursor = encode_cursor(page[len(page) - 1]) if page.has_next() else None
+    page.previous_cursor = encode_cursor(page[0]) if page.has_previous() else None
+    return page, paginator
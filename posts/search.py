@@ -0,0 +1,176 @@
+"""Полнотекстовый поиск по постам на FTS5.
+
+В виртуальной таблице ``posts_search`` одна строка на пост (текст, название
+группы, имя автора) и по строке на комментарий. В индекс пишутся основы
+слов после ``stemmer.stem``, поэтому «котики» находят «котиков». Строки
+обновляются сигналами при сохранении и удалении постов, комментариев,
+групп и пользователей. Выдача ранжируется по BM25, у поста берётся лучшая
+из его строк; совпадения подсвечиваются уже в Python по исходному тексту.
+"""
+import re
+from itertools import islice
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Comment, Post, batched_by_pk
+from .stemmer import stem
+
+TABLE = "posts_search"
+WORDS = re.compile(r"\w+")
+# веса колонок text, group_title, author для bm25(); у комментариев вес текста ниже
+WEIGHTS = (1.0, 2.0, 2.0)
+COMMENT_WEIGHT = 0.5
+SNIPPET_WORDS = 40
+BATCH_SIZE = 1000
+
+
+def stems(text):
+    return [stem(word) for word in WORDS.findall(text or "")]
+
+
+def indexed(text):
+    return " ".join(stems(text))
+
+
+def create_table(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Создаёт таблицу индекса; подключён к ``post_migrate``."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+                       "post_id UNINDEXED, comment_id UNINDEXED, text, group_title, author, "
+                       "tokenize = 'unicode61 remove_diacritics 2')")
+
+
+def author_name(user):
+    return " ".join(filter(None, (user.username, user.first_name, user.last_name)))
+
+
+def chunks(rows, size=BATCH_SIZE):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+# rowid строк индекса выводится из pk, чтобы переписывать и удалять их без полного просмотра
+def post_rowid(post_id):
+    return post_id * 2
+
+
+def comment_rowid(comment_id):
+    return comment_id * 2 + 1
+
+
+def index_posts(posts):
+    """Переписывает строки постов из queryset ``posts`` (без комментариев) пачками."""
+    with connection.cursor() as cursor:
+        for batch in batched_by_pk(posts.select_related("author", "group"), BATCH_SIZE):
+            rows = [(post.pk, indexed(post.text), indexed(post.group.title if post.group else ""),
+                     indexed(author_name(post.author))) for post in batch]
+            cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [(post_rowid(row[0]),) for row in rows])
+            cursor.executemany(f"INSERT INTO {TABLE} (rowid, post_id, comment_id, text, group_title, author) "
+                               "VALUES (%s, %s, NULL, %s, %s, %s)", [(post_rowid(row[0]), *row) for row in rows])
+
+
+def index_comments(comments):
+    rows = ((comment.post_id, comment.pk, indexed(comment.text)) for comment in comments)
+    with connection.cursor() as cursor:
+        for batch in chunks(rows):
+            cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [(comment_rowid(row[1]),) for row in batch])
+            cursor.executemany(f"INSERT INTO {TABLE} (rowid, post_id, comment_id, text, group_title, author) "
+                               "VALUES (%s, %s, %s, %s, '', '')", [(comment_rowid(row[1]), *row) for row in batch])
+
+
+def remove_post(post_id):
+    """Удаляет строку поста; строки комментариев снимаются их собственными сигналами."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [post_rowid(post_id)])
+
+
+def remove_comment(comment_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [comment_rowid(comment_id)])
+
+
+def rebuild():
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+    index_posts(Post.objects.all())
+    for comments in batched_by_pk(Comment.objects.only("pk", "post_id", "text"), BATCH_SIZE):
+        index_comments(comments)
+
+
+def match_expression(query):
+    """Запрос FTS5: все основы слов запроса, каждая как префикс."""
+    return " ".join(f'"{word}"*' for word in stems(query))
+
+
+class SearchResults:
+    """Ленивая выдача поиска для ``Paginator``: считает и режет на стороне SQLite."""
+
+    def __init__(self, query):
+        self.query = query
+        self.words = set(stems(query))
+        self.expression = match_expression(query)
+        weights = ", ".join(str(weight) for weight in WEIGHTS)
+        # bm25() нельзя звать из агрегирующего запроса, поэтому совпадения материализуются в CTE
+        self.ranked = (f"WITH matches AS MATERIALIZED (SELECT post_id, comment_id, bm25({TABLE}, 0, 0, {weights})"
+                       f" AS rank FROM {TABLE} WHERE {TABLE} MATCH %s) SELECT post_id, MIN(CASE WHEN comment_id"
+                       f" IS NULL THEN rank ELSE rank * {COMMENT_WEIGHT} END) AS score FROM matches GROUP BY post_id")
+
+    def count(self):
+        if not self.expression:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(DISTINCT post_id) FROM {TABLE} WHERE {TABLE} MATCH %s", [self.expression])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, window):
+        if not self.expression or window.stop <= window.start:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(f"{self.ranked} ORDER BY score, post_id DESC LIMIT %s OFFSET %s",
+                           [self.expression, window.stop - window.start, window.start])
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                return []
+            cursor.execute(f"SELECT MIN(comment_id) FROM {TABLE} WHERE {TABLE} MATCH %s AND comment_id IS NOT NULL"
+                           f" AND post_id IN ({', '.join(['%s'] * len(ids))}) GROUP BY post_id",
+                           [self.expression, *ids])
+            comment_ids = [row[0] for row in cursor.fetchall()]
+        posts = Post.objects.for_feed().in_bulk(ids)
+        results = [posts[pk] for pk in ids if pk in posts]
+        comments = {comment.post_id: comment for comment in Comment.objects.filter(pk__in=comment_ids)}
+        for post in results:
+            post.highlighted_text = highlight(post.text, self.words)
+            comment = comments.get(post.pk)
+            post.highlighted_comment = highlight(comment.text, self.words) if comment else ""
+        return results
+
+
+def highlight(text, words, limit=SNIPPET_WORDS):
+    """Экранированный ``text``, где слова с основой из ``words`` обёрнуты в ``<mark>``.
+
+    Длинный текст обрезается до ``limit`` слов вокруг первого совпадения.
+    """
+    tokens = WORDS.split(text)
+    found = WORDS.findall(text)
+    if not found:
+        return escape(text)
+    marked = [any(stem(word).startswith(base) for base in words) for word in found]
+    first = marked.index(True) if True in marked else 0
+    start = max(first - limit // 2, 0)
+    stop = start + limit
+    parts = ["… " if start else escape(tokens[0])]
+    for i, word in enumerate(found[start:stop], start):
+        if i > start:
+            parts.append(escape(tokens[i]))
+        parts.append(f"<mark>{escape(word)}</mark>" if marked[i] else escape(word))
+    parts.append(escape(tokens[-1]) if stop >= len(found) else " …")
+    return mark_safe("".join(parts))
@@ -0,0 +1,133 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import cache, search, thumbnails, timeline
+from .models import AuthorStats, Comment, Follow, Group, MediaBlob, Post, User
+
+
+@receiver(post_save, sender=Comment)
+def increment_comment_count(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(comment_count=F("comment_count") + 1,
+                                                        card_version=F("card_version") + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_count(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id, comment_count__gt=0).update(comment_count=F("comment_count") - 1,
+                                                                         card_version=F("card_version") + 1)
+
+
+@receiver(post_save, sender=Post)
+def update_post_counters(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.bump(instance.author_id, post_count=1)
+        timeline.fan_out(instance)
+    else:
+        Post.objects.filter(pk=instance.pk).bump_card_version()
+
+
+@receiver(post_delete, sender=Post)
+def decrement_post_count(sender, instance, **kwargs):
+    AuthorStats.objects.bump(instance.author_id, post_count=-1)
+
+
+def release_image(name):
+    if name and MediaBlob.objects.release(name):
+        transaction.on_commit(lambda: delete_if_unreferenced(name))
+
+
+def delete_if_unreferenced(name):
+    """Удаляет файлы, если до коммита ту же картинку не загрузили снова.
+
+    Хранилище не пишет файл, который уже есть, поэтому новый пост с теми же
+    байтами ссылается на файл, удаление которого уже запланировано.
+    """
+    if MediaBlob.objects.filter(name=name).exists() or Post.objects.filter(image=name).exists():
+        return
+    thumbnails.delete_files(name)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_image(sender, instance, update_fields=None, **kwargs):
+    if instance.pk and (update_fields is None or "image" in update_fields):
+        instance._previous_image = (Post.objects.filter(pk=instance.pk)
+                                    .values_list("image", flat=True).first() or "")
+
+
+@receiver(post_save, sender=Post)
+def update_image_refcount(sender, instance, created, **kwargs):
+    previous = instance.__dict__.pop("_previous_image", "" if created else None)
+    if previous is not None and (instance.image.name or "") != previous:
+        if instance.image:
+            MediaBlob.objects.acquire(instance.image.name)
+        release_image(previous)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    release_image(instance.image.name)
+
+
+@receiver(post_save, sender=Follow)
+def increment_follow_counts(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.bump(instance.author_id, follower_count=1)
+        AuthorStats.objects.bump(instance.user_id, following_count=1)
+        timeline.backfill(instance.user_id, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def decrement_follow_counts(sender, instance, **kwargs):
+    AuthorStats.objects.bump(instance.author_id, follower_count=-1)
+    AuthorStats.objects.bump(instance.user_id, following_count=-1)
+    timeline.remove(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def reset_group_cards(sender, instance, **kwargs):
+    instance.posts.bump_card_version()
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_posts(Post.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, **kwargs):
+    search.index_comments([instance])
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    search.remove_comment(instance.pk)
+
+
+@receiver(post_save, sender=Group)
+def reindex_group_posts(sender, instance, created, **kwargs):
+    if not created:
+        search.index_posts(instance.posts.all())
+
+
+@receiver(post_save, sender=User)
+def reindex_author_posts(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not {"username", "first_name", "last_name"} & set(update_fields)):
+        return
+    search.index_posts(instance.posts.all())
+
+
+@receiver([post_save, post_delete], sender=Post)
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=Group)
+@receiver([post_save, post_delete], sender=Follow)
+def invalidate_feeds(sender, **kwargs):
+    cache.invalidate(cache.FEED)
@@ -0,0 +1,94 @@
+"""Стеммер русского языка по алгоритму Snowball (Портер).
+
+https://snowballstem.org/algorithms/russian/stemmer.html
+Слова не на кириллице возвращаются как есть, только в нижнем регистре.
+"""
+import re
+
+VOWELS = "аеиоуыэюя"
+
+PERFECTIVE_GERUND = (("в", "вши", "вшись"), ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись"))
+ADJECTIVE = ((), ("ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем", "им", "ым", "ом",
+                  "его", "ого", "ему", "ому", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею"))
+PARTICIPLE = (("ем", "нн", "вш", "ющ", "щ"), ("ивш", "ывш", "ующ"))
+REFLEXIVE = ((), ("ся", "сь"))
+VERB = (("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют", "ны", "ть", "ешь", "нно"),
+        ("ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил", "ыл", "им", "ым", "ен",
+         "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт", "ены", "ить", "ыть", "ишь", "ую", "ю"))
+NOUN = ((), ("а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и", "ией", "ей", "ой", "ий",
+             "й", "иям", "ям", "ием", "ем", "ам", "ом", "о", "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю",
+             "ия", "ья", "я"))
+SUPERLATIVE = ((), ("ейш", "ейше"))
+DERIVATIONAL = ((), ("ост", "ость"))
+
+CYRILLIC = re.compile(r"^[а-яё]+$")
+
+
+def strip_ending(rv, groups):
+    """Отрезает самое длинное окончание из ``groups``; ``None``, если его нет.
+
+    Окончания первой группы снимаются, только если перед ними стоит «а» или «я».
+    """
+    conditional, plain = groups
+    matches = [(ending, True) for ending in conditional if rv.endswith(ending)]
+    matches += [(ending, False) for ending in plain if rv.endswith(ending)]
+    if not matches:
+        return None
+    ending, needs_a = max(matches, key=lambda match: len(match[0]))
+    stem = rv[:-len(ending)]
+    if needs_a and not stem.endswith(("а", "я")):
+        return None
+    return stem
+
+
+def region(word, start=0):
+    """Начало области после первой пары «гласная, согласная» начиная с ``start``."""
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def stem(word):
+    word = word.lower().replace("ё", "е")
+    if not CYRILLIC.match(word):
+        return word
+    first_vowel = next((i for i, char in enumerate(word) if char in VOWELS), None)
+    if first_vowel is None:
+        return word
+    prefix, rv = word[:first_vowel + 1], word[first_vowel + 1:]
+    r2 = region(word, region(word)) - len(prefix)
+
+    # шаг 1: деепричастие, иначе возвратная частица и прилагательное, глагол или существительное
+    stripped = strip_ending(rv, PERFECTIVE_GERUND)
+    if stripped is None:
+        rv = strip_ending(rv, REFLEXIVE) or rv
+        stripped = strip_ending(rv, ADJECTIVE)
+        if stripped is not None:
+            stripped = strip_ending(stripped, PARTICIPLE) or stripped
+        else:
+            stripped = strip_ending(rv, VERB)
+            if stripped is None:
+                stripped = strip_ending(rv, NOUN)
+    if stripped is not None:
+        rv = stripped
+
+    # шаг 2
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    # шаг 3: словообразовательное окончание в R2
+    stripped = strip_ending(rv, DERIVATIONAL)
+    if stripped is not None and len(stripped) >= r2:
+        rv = stripped
+
+    # шаг 4
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    else:
+        stripped = strip_ending(rv, SUPERLATIVE)
+        if stripped is not None:
+            rv = stripped[:-1] if stripped.endswith("нн") else stripped
+        elif rv.endswith("ь"):
+            rv = rv[:-1]
+    return prefix + rv
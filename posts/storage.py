@@ -0,0 +1,37 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Файл сохраняется под именем ``<каталог>/<ab>/<sha256><расширение>``, где
+``ab`` - первые два символа хэша. Если такой файл уже есть, повторная
+загрузка той же картинки ничего не пишет и возвращает существующее имя,
+поэтому одинаковые картинки разных постов лежат на диске один раз.
+Ссылки на файлы считает ``MediaBlob``.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        name = self.hashed_name(name, digest.hexdigest())
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def hashed_name(self, name, digest):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest[:2], f"{digest}{extension}").replace("\\", "/")
+
+    def get_available_name(self, name, max_length=None):
+        # имя уже уникально: одинаковое содержимое - один и тот же файл
+        return name
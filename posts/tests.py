@@ -1,12 +1,45 @@
+import json
+import os
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+import zlib
+from collections import defaultdict
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, Client
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Max
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase, TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import User, Post, Group
+from . import cache as cache_ns, dump, media_gc, search as search_index, thumbnails
+from .admin import EstimatedCountPaginator, PostAdmin
+from .stemmer import stem
+from .uploads import PostImageUploadHandler
+from yatube import metrics, slow_queries
+from .models import THUMBNAIL_PLACEHOLDER, AuthorStats, Comment, Follow, MediaBlob, TimelineEntry, User, Post, Group
+
 
+SMALL_GIF = (b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+             b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+             b'\x02\x4c\x01\x00\x3b')
 
+
+@override_settings(THUMBNAIL_WORKERS=0)
 class TestPostsApp(TestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username="test_user")
         self.user2 = User.objects.create_user(username="test_user2")
         self.group = Group.objects.create(slug="test_group")
@@ -105,13 +138,28 @@ class TestPostsApp(TestCase):
 
         post_2 = Post.objects.create(author=self.user, text="post_2")
         response = self.logged_client.get(reverse("index"))
-        self.assertNotContains(response, post_2.text)
+        self.assertContains(response, post_2.text)
 
-        cache.clear()
+        Post.objects.filter(pk=post_1.pk).update(text="changed behind the cache")
+        response = self.logged_client.get(reverse("index"))
+        self.assertContains(response, "post_1")
 
+        self.logged_client.post(reverse("post_edit", args=(self.user, post_1.id)), {"text": "edited post_1"})
         response = self.logged_client.get(reverse("index"))
-        self.assertContains(response, post_1.text)
-        self.assertContains(response, post_2.text)
+        self.assertContains(response, "edited post_1")
+
+    def test_cached_card_is_not_user_specific(self):
+        post = Post.objects.create(author=self.user, text="shared card")
+        edit_url = reverse("post_edit", args=(self.user, post.id))
+        self.assertContains(self.logged_client.get(reverse("index")), edit_url)
+        self.assertNotContains(self.logged_client2.get(reverse("index")), edit_url)
+        self.assertNotContains(self.unlogged_client.get(reverse("index")), edit_url)
+
+    def test_comment_resets_cached_card(self):
+        post = Post.objects.create(author=self.user, text="card with comments")
+        self.assertContains(self.logged_client.get(reverse("index")), "Добавить комментарий (0)")
+        self.logged_client2.post(reverse("add_comment", args=(self.user, post.id)), {"text": "hi"})
+        self.assertContains(self.logged_client.get(reverse("index")), "Добавить комментарий (1)")
 
     def test_follow(self):
         followers_count_before = self.user2.following.count()
@@ -150,3 +198,1224 @@ class TestPostsApp(TestCase):
         response = self.unlogged_client.post(reverse("add_comment", args=(self.user2.username, post.id)),
                                              {"text": comment_text})
         self.assertRedirects(response, f"{reverse('login')}?next={reverse('add_comment', args=(self.user2, post.id))}")
+
+
+class TestCursorPaginator(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username="cursor_user")
+        self.client = Client()
+        self.posts = [Post.objects.create(author=self.user, text=f"cursor post {i}") for i in range(25)]
+        # половина постов с одинаковой датой: порядок держится на id
+        Post.objects.filter(pk__in=[p.pk for p in self.posts[:12]]).update(pub_date=self.posts[0].pub_date)
+
+    def test_walk_feed_by_cursor(self):
+        expected = list(Post.objects.order_by("-pub_date", "-id").values_list("pk", flat=True))
+        response = self.client.get(reverse("index"))
+        seen = [post.pk for post in response.context["page"]]
+        page = response.context["page"]
+        while page.has_next():
+            response = self.client.get(reverse("index"), {"after": page.next_cursor, "page": page.next_page_number()})
+            page = response.context["page"]
+            seen += [post.pk for post in page]
+
+        self.assertEqual(seen, expected)
+        self.assertEqual(page.number, 3)
+
+        response = self.client.get(reverse("index"), {"before": page.previous_cursor, "page": 2})
+        self.assertEqual([post.pk for post in response.context["page"]], expected[10:20])
+
+    def test_cursor_page_skips_count(self):
+        first = self.client.get(reverse("index")).context["page"]
+        with self.settings(POSTS_PAGINATOR_COUNT=False):
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse("index"), {"after": first.next_cursor, "page": 2})
+        self.assertNotContains(response, "?page=3")
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.client.get(reverse("index"), {"after": "garbage"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page"]), 10)
+
+
+class TestCommentCount(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username="commenter")
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(author=self.user, text="post with comments")
+
+    def test_count_follows_comments(self):
+        for text in ("first", "second"):
+            self.client.post(reverse("add_comment", args=(self.user, self.post.id)), {"text": text})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+
+        Comment.objects.filter(text="first").first().delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_recount_command(self):
+        Comment.objects.create(post=self.post, author=self.user, text="comment")
+        Post.objects.update(comment_count=42)
+        call_command("recount_comments", stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_index_queries_do_not_depend_on_page_size(self):
+        def count_queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(reverse("index"))
+            return len(context)
+
+        Comment.objects.create(post=self.post, author=self.user, text="comment")
+        few = count_queries()
+        for i in range(9):
+            post = Post.objects.create(author=self.user, text=f"post {i}")
+            Comment.objects.create(post=post, author=self.user, text="comment")
+        self.assertEqual(count_queries(), few)
+
+
+class TestAuthorStats(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="stats_author")
+        self.reader = User.objects.create_user(username="stats_reader")
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def get_stats(self, user):
+        return AuthorStats.objects.for_author(User.objects.get(pk=user.pk))
+
+    def test_counters_follow_writes(self):
+        self.get_stats(self.author)
+        self.get_stats(self.reader)
+        post = Post.objects.create(author=self.author, text="counted")
+        self.client.get(reverse("profile_follow", args=(self.author,)))
+        stats = self.get_stats(self.author)
+        self.assertEqual((stats.follower_count, stats.following_count, stats.post_count), (1, 0, 1))
+        self.assertEqual(self.get_stats(self.reader).following_count, 1)
+
+        self.client.get(reverse("profile_unfollow", args=(self.author,)))
+        post.delete()
+        stats = self.get_stats(self.author)
+        self.assertEqual((stats.follower_count, stats.following_count, stats.post_count), (0, 0, 0))
+
+    def test_missing_row_is_built_from_data(self):
+        Post.objects.create(author=self.author, text="before stats")
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(reverse("profile", args=(self.author,)))
+        stats = response.context["stats"]
+        self.assertEqual((stats.follower_count, stats.post_count), (1, 1))
+
+    def test_reconcile_command_fixes_drift(self):
+        self.get_stats(self.author)
+        Post.objects.create(author=self.author, text="drift")
+        AuthorStats.objects.update(post_count=7, follower_count=3)
+        call_command("reconcile_author_stats", stdout=StringIO())
+        stats = self.get_stats(self.author)
+        self.assertEqual((stats.follower_count, stats.post_count), (0, 1))
+        self.assertEqual(AuthorStats.objects.count(), User.objects.count())
+
+
+class TestIsFollowing(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="followed_author")
+        self.reader = User.objects.create_user(username="follow_reader")
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_profile_uses_exists(self):
+        response = self.client.get(reverse("profile", args=(self.author,)))
+        self.assertFalse(response.context["is_following"])
+
+        Follow.objects.create(user=self.reader, author=self.author)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("profile", args=(self.author,)))
+        self.assertTrue(response.context["is_following"])
+        self.assertContains(response, reverse("profile_unfollow", args=(self.author,)))
+        follow_queries = [q["sql"] for q in context.captured_queries if "posts_follow" in q["sql"]]
+        self.assertEqual(len(follow_queries), 1)
+        self.assertIn("LIMIT 1", follow_queries[0])
+
+
+class TestFollowTimeline(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="timeline_author")
+        self.reader = User.objects.create_user(username="timeline_reader")
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed_texts(self):
+        response = self.client.get(reverse("follow_index"))
+        return [post.text for post in response.context["page"]]
+
+    def test_entries_follow_writes(self):
+        Post.objects.create(author=self.author, text="old post")
+        self.client.get(reverse("profile_follow", args=(self.author,)))
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 1)
+
+        post = Post.objects.create(author=self.author, text="new post")
+        self.assertEqual(self.feed_texts(), ["new post", "old post"])
+
+        post.delete()
+        self.assertEqual(self.feed_texts(), ["old post"])
+
+        self.client.get(reverse("profile_unfollow", args=(self.author,)))
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed_texts(), [])
+
+    def test_walk_feed_by_cursor(self):
+        self.client.get(reverse("profile_follow", args=(self.author,)))
+        for i in range(15):
+            Post.objects.create(author=self.author, text=f"feed post {i}")
+        page = self.client.get(reverse("follow_index")).context["page"]
+        response = self.client.get(reverse("follow_index"), {"after": page.next_cursor, "page": 2})
+        texts = [post.text for post in page] + [post.text for post in response.context["page"]]
+        self.assertEqual(texts, [f"feed post {i}" for i in reversed(range(15))])
+
+    def test_heavy_author_is_read_on_demand(self):
+        self.client.get(reverse("profile_follow", args=(self.author,)))
+        with self.settings(TIMELINE_FANOUT_LIMIT=1):
+            Post.objects.create(author=self.author, text="celebrity post")
+            self.assertFalse(TimelineEntry.objects.exists())
+            self.assertEqual(self.feed_texts(), ["celebrity post"])
+
+    def test_posts_return_to_feeds_when_author_drops_below_limit(self):
+        other = User.objects.create_user(username="timeline_other")
+        Follow.objects.create(user=other, author=self.author)
+        self.client.get(reverse("profile_follow", args=(self.author,)))
+        with self.settings(TIMELINE_FANOUT_LIMIT=2):
+            Post.objects.create(author=User.objects.get(pk=self.author.pk), text="heavy post")
+            self.assertEqual(AuthorStats.objects.get(author=self.author).pending_fanout, 1)
+            Follow.objects.get(user=other, author=self.author).delete()
+            self.assertFalse(TimelineEntry.objects.exists())
+            self.assertEqual(self.feed_texts(), ["heavy post"])
+
+            out = StringIO()
+            call_command("rebuild_timelines", "--pending", stdout=out)
+            self.assertIn("Разложены посты авторов: 1", out.getvalue())
+            self.assertEqual(AuthorStats.objects.get(author=self.author).pending_fanout, 0)
+            self.assertEqual(self.feed_texts(), ["heavy post"])
+        self.assertEqual(list(TimelineEntry.objects.values_list("user_id", flat=True)), [self.reader.pk])
+
+    def test_pending_backfill_skips_authors_above_limit(self):
+        self.client.get(reverse("profile_follow", args=(self.author,)))
+        with self.settings(TIMELINE_FANOUT_LIMIT=1):
+            Post.objects.create(author=User.objects.get(pk=self.author.pk), text="heavy post")
+            call_command("rebuild_timelines", "--author", self.author.username, stdout=StringIO())
+            self.assertEqual(AuthorStats.objects.get(author=self.author).pending_fanout, 1)
+            self.assertFalse(TimelineEntry.objects.exists())
+            self.assertEqual(self.feed_texts(), ["heavy post"])
+
+    def test_feed_cards_do_not_query_per_post(self):
+        self.client.get(reverse("profile_follow", args=(self.author,)))
+        group = Group.objects.create(title="group", slug="timeline-group")
+        Post.objects.create(author=self.author, group=group, text="first")
+        self.feed_texts()
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse("follow_index"))
+        for i in range(5):
+            Post.objects.create(author=self.author, group=group, text=f"post {i}")
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse("follow_index"))
+        self.assertEqual(len(many), len(few))
+
+
+CACHE_WORKER = """
+import sys
+
+import django
+django.setup()
+
+from posts import cache
+
+print(cache.namespace_version(cache.FEED), flush=True)
+sys.stdin.readline()
+print(cache.namespace_version(cache.FEED), flush=True)
+"""
+
+
+class TestSharedCache(TestCase):
+    workers = 3
+
+    def test_namespace_invalidation(self):
+        key = cache_ns.versioned_key(cache_ns.FEED, "index", 1)
+        cache.set(key, "page")
+        Post.objects.create(author=User.objects.create_user(username="ns_author"), text="new")
+        self.assertNotEqual(cache_ns.versioned_key(cache_ns.FEED, "index", 1), key)
+
+    def test_invalidation_reaches_every_worker(self):
+        with tempfile.TemporaryDirectory() as location:
+            env = dict(os.environ, CACHE_BACKEND="file", CACHE_LOCATION=location,
+                       DJANGO_SETTINGS_MODULE="yatube.settings")
+            workers = [subprocess.Popen([sys.executable, "-c", CACHE_WORKER], cwd=settings.BASE_DIR, env=env,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+                       for _ in range(self.workers)]
+            before = {int(worker.stdout.readline()) for worker in workers}
+
+            file_cache = {"default": {"BACKEND": settings.CACHE_BACKENDS["file"], "LOCATION": location,
+                                      "KEY_PREFIX": settings.CACHES["default"]["KEY_PREFIX"]}}
+            with self.settings(CACHES=file_cache):
+                version = cache_ns.invalidate(cache_ns.FEED)
+
+            after = set()
+            for worker in workers:
+                output, _ = worker.communicate("\n", timeout=30)
+                after.add(int(output))
+
+        self.assertEqual(len(before), 1)
+        self.assertEqual(after, {version})
+        self.assertNotIn(version, before)
+
+
+class TestAnonymousPageCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.author = User.objects.create_user(username="page_author")
+        self.post = Post.objects.create(author=self.author, text="cached page")
+        self.client = Client()
+
+    def test_second_hit_skips_database(self):
+        first = self.client.get(reverse("index"))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse("index"))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertIn("Last-Modified", second)
+
+    def test_pages_are_keyed_by_path_and_page(self):
+        for i in range(10):
+            Post.objects.create(author=self.author, text=f"filler {i}")
+        self.assertContains(self.client.get(reverse("index"), {"page": 2}), "cached page")
+        self.assertNotContains(self.client.get(reverse("index")), "cached page")
+
+    def test_conditional_get(self):
+        response = self.client.get(reverse("profile", args=(self.author,)))
+        etag = response["ETag"]
+        response = self.client.get(reverse("profile", args=(self.author,)), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Comment.objects.create(post=self.post, author=self.author, text="new comment")
+        response = self.client.get(reverse("profile", args=(self.author,)), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_changes_invalidate_pages(self):
+        self.client.get(reverse("index"))
+        Post.objects.create(author=self.author, text="fresh post")
+        self.assertContains(self.client.get(reverse("index")), "fresh post")
+
+    def test_logged_in_users_bypass_cache(self):
+        self.client.get(reverse("index"))
+        self.client.force_login(self.author)
+        response = self.client.get(reverse("index"))
+        self.assertNotIn("ETag", response)
+        self.assertContains(response, reverse("post_edit", args=(self.author, self.post.id)))
+
+
+class TestSQLitePragmas(SimpleTestCase):
+    writers = 4
+    readers = 4
+    rows_per_writer = 50
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.connections = ConnectionHandler({"default": {
+            "ENGINE": "yatube.sqlite3",
+            "NAME": os.path.join(directory.name, "concurrency.sqlite3"),
+            "PRAGMAS": settings.SQLITE_PRAGMAS,
+        }})
+        with self.connections["default"].cursor() as cursor:
+            cursor.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, writer INTEGER)")
+        self.connections.close_all()
+
+    def test_pragmas_applied_on_connect(self):
+        active = self.connections["default"].active_pragmas()
+        self.connections.close_all()
+        self.assertEqual(active["journal_mode"], "wal")
+        self.assertEqual(active["busy_timeout"], settings.SQLITE_PRAGMAS["busy_timeout"])
+
+    def test_concurrent_writers_and_readers(self):
+        errors = []
+        done = threading.Event()
+
+        def write(number):
+            try:
+                for _ in range(self.rows_per_writer):
+                    with self.connections["default"].cursor() as cursor:
+                        cursor.execute("INSERT INTO item (writer) VALUES (%s)", [number])
+            except Exception as error:
+                errors.append(error)
+            finally:
+                self.connections.close_all()
+
+        def read():
+            try:
+                while not done.is_set():
+                    with self.connections["default"].cursor() as cursor:
+                        cursor.execute("SELECT COUNT(*) FROM item")
+            except Exception as error:
+                errors.append(error)
+            finally:
+                self.connections.close_all()
+
+        writers = [threading.Thread(target=write, args=(i,)) for i in range(self.writers)]
+        readers = [threading.Thread(target=read) for _ in range(self.readers)]
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        with self.connections["default"].cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM item")
+            self.assertEqual(cursor.fetchone()[0], self.writers * self.rows_per_writer)
+        self.connections.close_all()
+
+
+
+class TestPersistentConnections(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "persistent.sqlite3")
+        self.connections = ConnectionHandler({"default": {
+            "ENGINE": "yatube.sqlite3",
+            "NAME": self.path,
+            "PRAGMAS": settings.SQLITE_PRAGMAS,
+            "CONN_MAX_AGE": 60,
+            "CONN_HEALTH_CHECKS": True,
+        }})
+        self.addCleanup(self.connections.close_all)
+        self.db = self.connections["default"]
+
+    def request(self):
+        """Как между запросами: ``close_old_connections`` и одно чтение."""
+        self.db.close_if_unusable_or_obsolete()
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        return self.db.connection
+
+    def test_connection_reused_until_max_age(self):
+        first = self.request()
+        self.assertIs(self.request(), first)
+        self.assertEqual(self.db.active_pragmas()["journal_mode"], "wal")
+        self.db.close_at = 0
+        self.assertIsNot(self.request(), first)
+
+    def test_replaced_database_file_is_reopened(self):
+        first = self.request()
+        replacement = f"{self.path}.new"
+        sqlite3.connect(replacement).execute("CREATE TABLE fresh (id INTEGER)").connection.close()
+        os.replace(replacement, self.path)
+        self.assertIsNot(self.request(), first)
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM fresh")
+
+    def test_health_checks_can_be_disabled(self):
+        self.db.settings_dict["CONN_HEALTH_CHECKS"] = False
+        first = self.request()
+        os.remove(self.path)
+        self.assertIs(self.request(), first)
+
+class TestQueryPlans(TestCase):
+    def test_feed_queries_use_indexes(self):
+        out = StringIO()
+        call_command("explain_feeds", stdout=out)
+        self.assertIn("timeline_user_pub_date", out.getvalue())
+        self.assertIn("post_group_pub_date", out.getvalue())
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class TestThumbnails(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.settings_override = self.settings(MEDIA_ROOT=media.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = User.objects.create_user(username="thumb_user")
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def upload(self, text):
+        image = SimpleUploadedFile(name="some.gif", content=SMALL_GIF, content_type="image/gif")
+        self.client.post(reverse("new_post"), {"text": text, "image": image})
+        return Post.objects.get(text=text)
+
+    def test_card_reads_stored_thumbnail(self):
+        post = self.upload("with thumbnail")
+        self.assertTrue(post.thumbnails)
+        self.assertNotEqual(post.card_thumbnail, THUMBNAIL_PLACEHOLDER)
+        self.assertContains(self.client.get(reverse("index")), post.card_thumbnail)
+
+    def test_responsive_variants(self):
+        post = self.upload("with variants")
+        variants = json.loads(post.image_variants)
+        self.assertEqual({v["width"] for v in variants}, set(settings.IMAGE_VARIANT_WIDTHS))
+        self.assertIn("webp", {v["format"] for v in variants})
+        for variant in variants:
+            self.assertEqual(variant["height"], round(variant["width"] * 339 / 960))
+            self.assertGreater(variant["bytes"], 0)
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f"{variants[0]['url']} {variants[0]['width']}w")
+
+    def test_image_bytes_benchmark(self):
+        self.upload("benchmarked")
+        out = StringIO()
+        call_command("bench_image_bytes", "--viewport", "480", "--accept", "webp", stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["posts"], 1)
+        self.assertGreater(report["before_bytes"], 0)
+        self.assertGreater(report["after_bytes"], 0)
+
+    def test_placeholder_until_ready(self):
+        with mock.patch.object(thumbnails, "generate"):
+            post = self.upload("pending thumbnail")
+        self.assertEqual(post.card_thumbnail, THUMBNAIL_PLACEHOLDER)
+        call_command("generate_thumbnails", stdout=StringIO())
+        post.refresh_from_db()
+        self.assertNotEqual(post.card_thumbnail, THUMBNAIL_PLACEHOLDER)
+
+    def test_same_image_is_stored_once(self):
+        first = self.upload("first copy")
+        with mock.patch.object(thumbnails, "get_thumbnail") as get_thumbnail:
+            second = self.upload("second copy")
+        get_thumbnail.assert_not_called()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(second.thumbnails, first.thumbnails)
+        self.assertEqual(os.listdir(os.path.dirname(first.image.path)), [os.path.basename(first.image.path)])
+        self.assertEqual(MediaBlob.objects.get(name=first.image.name).refcount, 2)
+
+    def test_files_removed_with_last_reference(self):
+        first = self.upload("first copy")
+        second = self.upload("second copy")
+        variants = [os.path.join(settings.MEDIA_ROOT, thumbnails.variant_name(first.image.name, v["width"], v["format"]))
+                    for v in json.loads(first.image_variants)]
+        with mock.patch("posts.signals.transaction.on_commit", side_effect=lambda func: func()):
+            first.delete()
+            self.assertTrue(os.path.exists(second.image.path))
+            second.delete()
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertFalse(os.path.exists(second.image.path))
+        self.assertFalse(any(os.path.exists(path) for path in variants))
+
+    def test_reupload_before_delete_keeps_file(self):
+        first = self.upload("first copy")
+        callbacks = []
+        with mock.patch("posts.signals.transaction.on_commit", side_effect=callbacks.append):
+            first.delete()
+        second = self.upload("second copy")
+        for callback in callbacks:
+            callback()
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertTrue(os.path.exists(second.image.path))
+        self.assertEqual(MediaBlob.objects.get(name=second.image.name).refcount, 1)
+
+    def test_generation_is_queued_on_worker_pool(self):
+        post = Post(pk=1, image="posts/some.gif")
+        generate = mock.patch.object(thumbnails, "generate", return_value={})
+        with self.settings(THUMBNAIL_WORKERS=1), generate as generate:
+            future = thumbnails.schedule(post)
+            self.assertEqual(future.result(timeout=5), {})
+        generate.assert_called_once_with(1, "posts/some.gif")
+
+
+def png_header(width, height):
+    """Начало PNG-файла: IHDR нужных размеров и начало пустого IDAT."""
+    ihdr = b"IHDR" + struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + ihdr + struct.pack(">I", zlib.crc32(ihdr))
+            + struct.pack(">I", 0) + b"IDAT")
+
+
+class TestImageUploads(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username="upload_user")
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+
+    def post_image(self, content, name="some.png"):
+        self.client.get(reverse("new_post"))
+        image = SimpleUploadedFile(name=name, content=content, content_type="image/png")
+        return self.client.post(reverse("new_post"), {
+            "text": "uploaded", "image": image,
+            "csrfmiddlewaretoken": self.client.cookies["csrftoken"].value,
+        })
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1024)
+    def test_oversized_file_rejected(self):
+        response = self.post_image(SMALL_GIF + b"\x00" * 4096, name="some.gif")
+        self.assertFormError(response, "form", "image", "Файл больше 1,0\xa0КБ.")
+        self.assertFalse(Post.objects.exists())
+
+    def test_decompression_bomb_rejected(self):
+        response = self.post_image(png_header(100000, 100000) + b"\x00" * 1024)
+        self.assertFormError(response, "form", "image", "Изображение слишком большое по площади.")
+        self.assertFalse(Post.objects.exists())
+
+    def test_csrf_still_checked(self):
+        image = SimpleUploadedFile(name="some.gif", content=SMALL_GIF, content_type="image/gif")
+        response = self.client.post(reverse("new_post"), {"text": "uploaded", "image": image})
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=64 * 1024 * 1024, IMAGE_UPLOAD_SPOOL_SIZE=256 * 1024)
+    def test_large_upload_is_spooled_to_disk(self):
+        handler = PostImageUploadHandler()
+        handler.new_file("image", "big.png", "image/png", None)
+        chunk = b"\x00" * handler.chunk_size
+        tracemalloc.start()
+        try:
+            handler.receive_data_chunk(png_header(1000, 1000), 0)
+            start = len(png_header(1000, 1000))
+            for _ in range(32 * 1024 * 1024 // len(chunk)):
+                handler.receive_data_chunk(chunk, start)
+                start += len(chunk)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        uploaded = handler.file_complete(start)
+        self.addCleanup(uploaded.close)
+        self.assertEqual(uploaded.size, start)
+        self.assertTrue(os.path.exists(uploaded.temporary_file_path()))
+        self.assertLess(peak, 4 * 1024 * 1024)
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class TestMediaGC(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.settings_override = self.settings(MEDIA_ROOT=media.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.client = Client()
+        self.client.force_login(User.objects.create_user(username="gc_user"))
+        image = SimpleUploadedFile(name="some.gif", content=SMALL_GIF, content_type="image/gif")
+        self.client.post(reverse("new_post"), {"text": "live", "image": image})
+        self.post = Post.objects.get(text="live")
+        self.orphans = [self.write("posts/old.gif"), self.write("posts/variants/deadbeef_480.webp"),
+                        self.write("cache/aa/bb/stale.jpg")]
+        self.live = [os.path.join(root, name) for root, _, names in os.walk(settings.MEDIA_ROOT)
+                     for name in names if os.path.join(root, name) not in self.orphans]
+        for path in self.orphans + self.live:
+            os.utime(path, (0, 0))
+
+    def write(self, name):
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as orphan:
+            orphan.write(SMALL_GIF)
+        return path
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command("gc_media", *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_reports_without_deleting(self):
+        output = self.gc("--dry-run")
+        self.assertIn("Можно удалить файлов: 3", output)
+        self.assertIn(f"({3 * len(SMALL_GIF)} байт)", output)
+        self.assertTrue(all(os.path.exists(path) for path in self.orphans))
+
+    def test_removes_only_orphans(self):
+        self.assertGreaterEqual(len(self.live), 3)
+        self.assertIn("Удалено файлов: 3", self.gc("--batch-size", "1"))
+        self.assertFalse(any(os.path.exists(path) for path in self.orphans))
+        self.assertTrue(all(os.path.exists(path) for path in self.live))
+
+    def test_fresh_files_are_kept(self):
+        fresh = self.write("posts/fresh.gif")
+        self.gc()
+        self.assertTrue(os.path.exists(fresh))
+
+    def test_incremental_passes_cover_all_directories(self):
+        dirs = media_gc.directories()
+        for number in range(len(dirs)):
+            self.gc("--incremental", "--dirs", "1")
+            # каждый запуск из cron - новый процесс со своим кэшем
+            cache.clear()
+            self.assertEqual(media_gc.read_position(), (number + 1) % len(dirs))
+        self.assertFalse(any(os.path.exists(path) for path in self.orphans))
+        self.assertTrue(all(os.path.exists(path) for path in self.live))
+
+
+class TestSearch(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username="search_user", first_name="Анна")
+        self.group = Group.objects.create(title="Домашние животные", slug="pets", description="pets")
+        self.client = Client()
+
+    def search(self, query, **params):
+        return self.client.get(reverse("search"), {"q": query, **params})
+
+    def found(self, query):
+        return [post.pk for post in self.search(query).context["page"]]
+
+    def test_stemmer(self):
+        for word, expected in (("котики", "котик"), ("котиков", "котик"), ("красивая", "красив"),
+                               ("возможности", "возможн"), ("прекраснейший", "прекрасн"), ("Django", "django")):
+            self.assertEqual(stem(word), expected)
+
+    def test_russian_forms_are_found_and_highlighted(self):
+        post = Post.objects.create(author=self.user, text="Мои котики спят <весь> день")
+        response = self.search("котиков")
+        self.assertEqual([p.pk for p in response.context["page"]], [post.pk])
+        self.assertContains(response, "Мои <mark>котики</mark> спят &lt;весь&gt; день")
+
+    def test_group_author_and_comment_are_indexed(self):
+        post = Post.objects.create(author=self.user, text="без ключевых слов", group=self.group)
+        Comment.objects.create(post=post, author=self.user, text="Отличная собака")
+        self.assertEqual(self.found("животных"), [post.pk])
+        self.assertEqual(self.found("анна"), [post.pk])
+        self.assertEqual(self.found("собаки"), [post.pk])
+        self.assertContains(self.search("собаки"), "<mark>собака</mark>")
+
+    def test_index_follows_changes(self):
+        post = Post.objects.create(author=self.user, text="старый текст", group=self.group)
+        comment = Comment.objects.create(post=post, author=self.user, text="комментарий про море")
+        post.text = "новый текст"
+        post.save()
+        self.assertEqual(self.found("старый"), [])
+        self.assertEqual(self.found("новый"), [post.pk])
+        comment.delete()
+        self.assertEqual(self.found("море"), [])
+        self.group.title = "Путешествия"
+        self.group.save()
+        self.assertEqual(self.found("путешествие"), [post.pk])
+        self.user.username = "renamed"
+        self.user.save()
+        self.assertEqual(self.found("renamed"), [post.pk])
+        post.delete()
+        self.assertEqual(self.found("новый"), [])
+
+    def test_ranked_by_bm25(self):
+        in_comment = Post.objects.create(author=self.user, text="про другое")
+        Comment.objects.create(post=in_comment, author=self.user, text="кстати, ёжик")
+        in_text = Post.objects.create(author=self.user, text="ёжик и ещё раз ёжик")
+        self.assertEqual(self.found("ежик"), [in_text.pk, in_comment.pk])
+
+    def test_paginated(self):
+        Post.objects.bulk_create(Post(author=self.user, text=f"закат номер {i}") for i in range(12))
+        search_index.rebuild()
+        response = self.search("закаты", page=2)
+        self.assertEqual(response.context["paginator"].count, 12)
+        self.assertEqual(len(response.context["page"]), 2)
+        self.assertContains(response, 'href="?q=%D0%B7%D0%B0%D0%BA%D0%B0%D1%82%D1%8B&amp;page=1"')
+        self.assertEqual(self.search("").context["paginator"].count, 0)
+
+
+class TestAdminChangelists(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.group = Group.objects.create(title="group", slug="group", description="group")
+
+    def add_rows(self, count):
+        for i in range(count):
+            author = User.objects.create_user(username=f"author_{Post.objects.count()}")
+            post = Post.objects.create(author=author, text=f"post {i}", group=self.group)
+            Comment.objects.create(post=post, author=author, text=f"comment {i}")
+            Follow.objects.create(user=self.admin, author=author)
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = [reverse(f"admin:posts_{model}_changelist") for model in ("post", "comment", "follow", "group")]
+        self.add_rows(2)
+        few = [self.queries(url) for url in urls]
+        self.add_rows(30)
+        self.assertEqual([self.queries(url) for url in urls], few)
+
+    def test_cursor_navigation(self):
+        self.add_rows(PostAdmin.list_per_page + 5)
+        url = reverse("admin:posts_post_changelist")
+        response = self.client.get(url)
+        last = response.context["cl"].result_list[PostAdmin.list_per_page - 1]
+        self.assertContains(response, f"?id__lt={last.pk}")
+        response = self.client.get(url, {"id__lt": last.pk})
+        self.assertEqual([post.pk for post in response.context["cl"].result_list],
+                         list(Post.objects.filter(pk__lt=last.pk).order_by("-pk").values_list("pk", flat=True)))
+        self.assertIsNone(response.context["cl"].next_cursor_url)
+
+    def test_estimated_count(self):
+        self.add_rows(5)
+        with mock.patch("posts.admin.EXACT_COUNT_LIMIT", 3):
+            paginator = EstimatedCountPaginator(Post.objects.all(), 2)
+            self.assertEqual(paginator.count, Post.objects.aggregate(top=Max("pk"))["top"])
+            self.assertEqual(EstimatedCountPaginator(Post.objects.filter(text__startswith="post"), 2).count, 3)
+
+    def test_username_prefix_search(self):
+        self.add_rows(12)
+        response = self.client.get(reverse("admin:posts_follow_changelist"), {"q": "@author_1"})
+        self.assertEqual({follow.author.username for follow in response.context["cl"].result_list},
+                         {"author_1", "author_10", "author_11"})
+        response = self.client.get(reverse("admin:posts_comment_changelist"), {"q": "comment 3"})
+        self.assertEqual([comment.text for comment in response.context["cl"].result_list], ["comment 3"])
+
+
+class TestExportImport(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        author = User.objects.create_user(username="dump_author", first_name="Анна")
+        reader = User.objects.create_user(username="dump_reader")
+        group = Group.objects.create(title="Группа", slug="dump", description="описание")
+        for i in range(5):
+            post = Post.objects.create(author=author, text=f"пост {i}", group=group if i % 2 else None)
+            Comment.objects.create(post=post, author=reader, text=f"комментарий {i}")
+        Follow.objects.create(user=reader, author=author)
+
+    def snapshot(self):
+        return {
+            "users": sorted(User.objects.values_list("username", "first_name", "password", "is_staff",
+                                                     "is_superuser")),
+            "groups": sorted(Group.objects.values_list("slug", "title")),
+            "posts": sorted(Post.objects.values_list("author__username", "pub_date", "text", "group__slug",
+                                                     "comment_count")),
+            "comments": sorted(Comment.objects.values_list("post__text", "author__username", "created", "text")),
+            "follows": sorted(Follow.objects.values_list("user__username", "author__username")),
+        }
+
+    def wipe(self):
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        cache.clear()
+
+    def import_dump(self, path, *args):
+        out = StringIO()
+        call_command("yatube_import", path, "--batch-size", "2", *args, stdout=out)
+        return out.getvalue()
+
+    def test_jsonl_round_trip(self):
+        before = self.snapshot()
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as dump_file:
+            self.addCleanup(os.unlink, dump_file.name)
+        call_command("yatube_export", dump_file.name, stderr=StringIO())
+        with open(dump_file.name, encoding="utf-8") as stream:
+            lines = [json.loads(line) for line in stream]
+        self.assertEqual([line["model"] for line in lines], ["user"] * 2 + ["group"] + ["post"] * 5
+                         + ["comment"] * 5 + ["follow"])
+        self.wipe()
+        self.assertIn("post: создано 5, пропущено 0", self.import_dump(dump_file.name))
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(TimelineEntry.objects.count(), 5)
+        self.assertIn("comment: создано 0, пропущено 5", self.import_dump(dump_file.name, "--skip-derived"))
+        self.assertEqual(self.snapshot(), before)
+
+    def test_csv_round_trip(self):
+        before = self.snapshot()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        call_command("yatube_export", directory.name, "--format", "csv", stderr=StringIO())
+        self.assertEqual(sorted(os.listdir(directory.name)), sorted(f"{model}.csv" for model in dump.MODELS))
+        self.wipe()
+        self.import_dump(directory.name)
+        self.assertEqual(self.snapshot(), before)
+
+    def export_jsonl(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as dump_file:
+            self.addCleanup(os.unlink, dump_file.name)
+        call_command("yatube_export", dump_file.name, stderr=StringIO())
+        with open(dump_file.name, encoding="utf-8") as stream:
+            return dump_file.name, [json.loads(line) for line in stream]
+
+    def keys(self, lines):
+        return sorted((line["model"], line["source"], line["id"]) for line in lines if "source" in line)
+
+    def test_round_trip_into_same_database(self):
+        before = self.snapshot()
+        path, lines = self.export_jsonl()
+        out = self.import_dump(path)
+        self.assertIn("post: создано 0, пропущено 5", out)
+        self.assertIn("comment: создано 0, пропущено 5", out)
+        self.assertEqual(self.snapshot(), before)
+
+        self.wipe()
+        self.import_dump(path)
+        path, again = self.export_jsonl()
+        self.assertEqual(self.keys(again), self.keys(lines))
+        self.assertIn("post: создано 0, пропущено 5", self.import_dump(path))
+        self.assertEqual(self.snapshot(), before)
+
+    def test_two_sources_with_same_ids(self):
+        path, lines = self.export_jsonl()
+        for line in lines:
+            if line["model"] in ("post", "comment"):
+                line.update(source="other", text=line["text"] + " B")
+            if line["model"] == "comment":
+                line["post_source"] = "other"
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as other:
+            self.addCleanup(os.unlink, other.name)
+            other.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines))
+        self.wipe()
+        self.import_dump(path)
+        self.assertIn("comment: создано 5, пропущено 0", self.import_dump(other.name))
+        self.assertEqual(Post.objects.count(), 10)
+        for comment in Comment.objects.select_related("post"):
+            self.assertEqual(comment.text.endswith(" B"), comment.post.text.endswith(" B"))
+        self.assertEqual(Comment.objects.filter(text__endswith=" B").count(), 5)
+
+    def test_same_dates_staff_flags_and_feed_cache(self):
+        User.objects.filter(username="dump_author").update(is_staff=True, is_superuser=True)
+        post = Post.objects.first()
+        Post.objects.update(pub_date=post.pub_date)
+        Comment.objects.update(post=post, created=post.pub_date)
+        Post.objects.recount_comments()
+        before = self.snapshot()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        call_command("yatube_export", directory.name, "--format", "csv", stderr=StringIO())
+        self.wipe()
+        version = cache_ns.namespace_version(cache_ns.FEED)
+        self.assertIn("comment: создано 5, пропущено 0", self.import_dump(directory.name))
+        self.assertEqual(self.snapshot(), before)
+        self.assertGreater(cache_ns.namespace_version(cache_ns.FEED), version)
+        self.assertIn("post: создано 0, пропущено 5", self.import_dump(directory.name))
+        self.assertEqual(self.snapshot(), before)
+
+
+class TestBenchmarks(TestCase):
+    def test_generate_and_measure(self):
+        call_command("generate_data", "--users", "30", "--groups", "3", "--posts", "200", "--follows", "5",
+                     "--batch-size", "50", stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertTrue(TimelineEntry.objects.exists())
+        self.assertEqual(Post.objects.get(pk=Comment.objects.first().post_id).comment_count,
+                         Comment.objects.filter(post_id=Comment.objects.first().post_id).count())
+        out = StringIO()
+        call_command("bench_feeds", "--requests", "3", "--pages", "1,5", stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["dataset"]["posts"], 200)
+        self.assertEqual({(row["view"], row["page"]) for row in report["results"]},
+                         {(view, page) for view in ("index", "group_posts", "profile", "follow_index")
+                          for page in (1, 5)} | {("post_view", None)})
+        for row in report["results"]:
+            self.assertEqual(row["status"], 200)
+            self.assertLessEqual(row["p50_ms"], row["p99_ms"])
+            self.assertGreater(row["queries"], 0)
+            self.assertGreater(row["peak_memory_kb"], 0)
+
+    def test_bench_feeds_rejects_non_positive_requests(self):
+        with self.assertRaisesMessage(CommandError, "нужно целое число больше нуля"):
+            call_command("bench_feeds", "--requests", "0")
+
+
+class TestServerTiming(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username="timer", password="12345")
+        self.client.force_login(self.user)
+        for i in range(3):
+            Post.objects.create(text=f"post {i}", author=self.user)
+
+    def entries(self, response):
+        return {part.split(";")[0]: part for part in response["Server-Timing"].split(", ")}
+
+    def test_header_lists_sql_templates_and_cache(self):
+        entries = self.entries(self.client.get(reverse("index")))
+        self.assertRegex(entries["sql"], r'^sql;dur=[\d.]+;desc="[1-9]\d* queries"$')
+        self.assertIn("tpl", entries)
+        self.assertIn("tpl-index.html", entries)
+        self.assertRegex(entries["tpl-post_card.html"], r'desc="3x"$')
+        self.assertRegex(entries["cache"], r'hit=\d+ miss=[1-9]')
+        self.assertIn("total", entries)
+
+    def test_outsiders_get_only_total(self):
+        response = Client().get(reverse("index"), REMOTE_ADDR="10.0.0.5")
+        self.assertRegex(response["Server-Timing"], r"^total;dur=[\d.]+$")
+        response = self.client.get(reverse("index"), REMOTE_ADDR="10.0.0.5")
+        self.assertRegex(response["Server-Timing"], r"^total;dur=[\d.]+$")
+
+    def test_staff_get_details_from_any_address(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        entries = self.entries(self.client.get(reverse("index"), REMOTE_ADDR="10.0.0.5"))
+        self.assertIn("tpl-post_card.html", entries)
+        self.assertIn("cache", entries)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_sampled_requests_are_logged(self):
+        with self.assertLogs("yatube.timing", "INFO") as logs:
+            self.client.get(reverse("profile", args=[self.user.username]))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "profile")
+        self.assertEqual(record["status"], 200)
+        self.assertGreater(record["queries"], 0)
+        self.assertEqual(record["templates"]["post_card.html"]["count"], 3)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_logged(self):
+        with mock.patch("yatube.middleware.logger") as logger:
+            self.client.get(reverse("index"))
+        logger.info.assert_not_called()
+
+
+METRICS_WORKER = """
+import django
+django.setup()
+
+from django.test import Client
+
+for _ in range(%d):
+    Client().get("/metrics")
+"""
+
+
+def parse_metrics(text):
+    samples = defaultdict(float)
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+@override_settings(THUMBNAIL_WORKERS=0, METRICS_FLUSH_INTERVAL=0)
+class TestMetrics(TestCase):
+    workers = 3
+    requests = 4
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.settings_override = self.settings(METRICS_DIR=directory.name, MEDIA_ROOT=media.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        # значения этого процесса попадают в новый каталог с первым же запросом
+        self.scrape()
+
+    def scrape(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        return parse_metrics(response.content.decode())
+
+    def test_views_queries_cache_and_uploads(self):
+        user = User.objects.create_user(username="metrics_user")
+        self.client.force_login(user)
+        before = self.scrape()
+        self.client.get(reverse("index"))
+        image = SimpleUploadedFile(name="some.gif", content=SMALL_GIF, content_type="image/gif")
+        self.client.post(reverse("new_post"), {"text": "with image", "image": image})
+        after = self.scrape()
+
+        def delta(name):
+            return after[name] - before[name]
+        self.assertEqual(delta('yatube_request_duration_seconds_count{view="index"}'), 1)
+        self.assertEqual(delta('yatube_request_duration_seconds_bucket{le="+Inf",view="index"}'), 1)
+        self.assertGreater(delta('yatube_db_queries_total{view="index"}'), 0)
+        self.assertEqual(delta("yatube_upload_size_bytes_count"), 1)
+        self.assertEqual(delta("yatube_upload_size_bytes_sum"), len(SMALL_GIF))
+        # миниатюры постов из других тестов могут дозревать в фоновых потоках
+        self.assertGreaterEqual(delta("yatube_thumbnail_generation_seconds_count"), 1)
+        lookups = after['yatube_cache_requests_total{result="hit"}'] + after['yatube_cache_requests_total{result="miss"}']
+        self.assertAlmostEqual(after["yatube_cache_hit_ratio"],
+                               after['yatube_cache_requests_total{result="hit"}'] / lookups)
+
+    def test_scrape_adds_up_across_workers(self):
+        env = dict(os.environ, METRICS_DIR=settings.METRICS_DIR, DJANGO_SETTINGS_MODULE="yatube.settings")
+        workers = [subprocess.Popen([sys.executable, "-c", METRICS_WORKER % self.requests],
+                                    cwd=settings.BASE_DIR, env=env)
+                   for _ in range(self.workers)]
+        for worker in workers:
+            self.assertEqual(worker.wait(timeout=60), 0)
+        key = metrics.metric_key(metrics.REQUEST_LATENCY.name, {"view": "metrics"})
+        own = metrics.registry.values.get(key, [0])[-1]
+        samples = self.scrape()
+        self.assertEqual(len(os.listdir(settings.METRICS_DIR)), self.workers + 1)
+        self.assertEqual(samples['yatube_request_duration_seconds_count{view="metrics"}'],
+                         self.workers * self.requests + own)
+
+    @override_settings(METRICS_FLUSH_INTERVAL=0)
+    def test_concurrent_flushes_keep_file_whole(self):
+        counter = metrics.Counter("yatube_test_flushes_total", "test")
+        key = metrics.metric_key(counter.name, {})
+        errors = []
+
+        def work():
+            try:
+                for _ in range(50):
+                    counter.inc()
+            except Exception as error:
+                errors.append(error)
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(metrics.read(metrics.registry.path())[key], metrics.registry.values[key])
+        self.assertEqual(os.listdir(settings.METRICS_DIR), [f"{os.getpid()}.json"])
+
+    def test_hidden_from_other_addresses(self):
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_WORKERS=0)
+class TestSlowQueries(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username="slow_user")
+        self.client.force_login(self.user)
+        Post.objects.create(author=self.user, text="slow")
+
+    def logged(self, url):
+        with self.assertLogs("yatube.slow_queries", "INFO") as logs:
+            self.client.get(url)
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_entries_carry_view_user_stack_and_plan(self):
+        entries = self.logged(reverse("profile", args=[self.user.username]))
+        self.assertTrue(entries)
+        for entry in entries:
+            self.assertEqual(entry["view"], "profile")
+            self.assertEqual(entry["user_id"], self.user.pk)
+            self.assertLessEqual(len(entry["stack"]), settings.SLOW_QUERY_STACK_DEPTH)
+        posts_query = next(entry for entry in entries if 'FROM "posts_post"' in entry["shape"]
+                           and entry["shape"].startswith("SELECT"))
+        self.assertTrue(posts_query["plan"])
+        self.assertTrue(any(frame.startswith("posts/") for frame in posts_query["stack"]))
+
+    def test_log_has_no_values(self):
+        User.objects.create_user(username="slow_login", password="slow-secret-password")
+        client = Client()
+        with self.assertLogs("yatube.slow_queries", "INFO") as logs:
+            client.post(reverse("login"), {"username": "slow_login", "password": "slow-secret-password"})
+        session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.assertTrue(any("django_session" in record.getMessage() for record in logs.records))
+        for record in logs.records:
+            message = record.getMessage()
+            self.assertNotIn(session_key, message)
+            self.assertNotIn("slow_login", message)
+            self.assertNotIn("sql", json.loads(message))
+
+    def test_shape_drops_values(self):
+        self.assertEqual(slow_queries.shape("SELECT * FROM t WHERE a = 'x''y' AND b IN (%s, %s, %s) LIMIT 10"),
+                         "SELECT * FROM t WHERE a = ? AND b IN (...) LIMIT ?")
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=-1)
+    def test_disabled(self):
+        with mock.patch("yatube.slow_queries.logger") as logger:
+            self.client.get(reverse("index"))
+        logger.info.assert_not_called()
+
+    def test_summary_command(self):
+        entries = self.logged(reverse("follow_index")) + self.logged(reverse("follow_index"))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "slow.log")
+            with open(f"{path}.1", "w") as backup, open(path, "w") as current:
+                backup.write(json.dumps(entries[0]) + "\n")
+                current.writelines(json.dumps(entry) + "\n" for entry in entries[1:])
+            out = StringIO()
+            call_command("slow_queries", "--log", path, "--view", "follow_index", "--top", "3", stdout=out)
+        report = out.getvalue()
+        self.assertIn(f"Медленных запросов: {len(entries)}", report)
+        self.assertIn("1. ", report)
+        self.assertIn("план:", report)
+        self.assertNotIn("4. ", report)
+
+
+REPLICA_WORKER = """
+import json
+import sqlite3
+import time
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client
+
+from posts.models import Post, User
+
+
+def replicate():
+    # репликация с задержкой: реплика догоняет основную базу только здесь
+    connections["replica1"].close()
+    source = sqlite3.connect(settings.DATABASES["default"]["NAME"])
+    target = sqlite3.connect(settings.DATABASES["replica1"]["NAME"])
+    source.backup(target)
+    source.close()
+    target.close()
+
+
+def sees(client, text):
+    return text in client.get("/").content.decode()
+
+
+call_command("migrate", verbosity=0)
+writer, reader = Client(), Client()
+writer.force_login(User.objects.create_user("writer"))
+reader.force_login(User.objects.create_user("reader"))
+replicate()
+
+results = {}
+writer.post("/new/", {"text": "fresh post"})
+post = Post.objects.using("default").get(text="fresh post")
+results["pinned"] = "db_pin" in writer.cookies
+results["writer_sees"] = sees(writer, "fresh post")
+results["reader_sees"] = sees(reader, "fresh post")
+results["reader_post_status"] = reader.get(f"/writer/{post.pk}/").status_code
+time.sleep(settings.REPLICA_PIN_SECONDS + 0.1)
+results["writer_sees_after_pin"] = sees(writer, "fresh post")
+replicate()
+results["reader_sees_after_sync"] = sees(reader, "fresh post")
+print(json.dumps(results))
+"""
+
+
+class TestReplicaRouting(TestCase):
+    def test_reads_follow_replica_except_after_writes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, DJANGO_SETTINGS_MODULE="yatube.settings", THUMBNAIL_WORKERS="0",
+                       DATABASE_NAME=os.path.join(directory, "primary.sqlite3"),
+                       DATABASE_REPLICAS=os.path.join(directory, "replica.sqlite3"),
+                       REPLICA_PIN_SECONDS="1", METRICS_DIR=os.path.join(directory, "metrics"))
+            output = subprocess.run([sys.executable, "-c", REPLICA_WORKER], cwd=settings.BASE_DIR, env=env,
+                                    stdout=subprocess.PIPE, universal_newlines=True, timeout=120, check=True).stdout
+        self.assertEqual(json.loads(output), {
+            "pinned": True,
+            "writer_sees": True,
+            "reader_sees": False,
+            "reader_post_status": 404,
+            "writer_sees_after_pin": False,
+            "reader_sees_after_sync": True,
+        })
+
+    def test_without_replicas_reads_stay_on_default(self):
+        user = User.objects.create_user(username="no_replicas")
+        self.client.force_login(user)
+        self.client.post(reverse("new_post"), {"text": "primary only"})
+        self.assertNotIn("db_pin", self.client.cookies)
+        self.assertContains(self.client.get(reverse("index")), "primary only")
@@ -0,0 +1,129 @@
+"""Фоновая подготовка миниатюр для картинок постов.
+
+``schedule`` ставит генерацию всех размеров из ``THUMBNAIL_SIZES`` в пул
+потоков; готовые адреса сохраняются в ``Post.thumbnails``, а до этого
+карточка показывает заглушку. Там же готовятся варианты картинки для
+``srcset`` (``IMAGE_VARIANT_WIDTHS`` x ``IMAGE_VARIANT_FORMATS``), их
+размеры сохраняются в ``Post.image_variants``. При ``THUMBNAIL_WORKERS = 0``
+всё готовится сразу, в том же запросе.
+
+Картинки лежат в ``ContentAddressedStorage``, и имя файла - хэш его
+содержимого, поэтому миниатюры и варианты готовятся один раз на картинку:
+пост с уже обработанной картинкой получает готовые адреса от соседа.
+"""
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import F
+from sorl.thumbnail import delete, get_thumbnail
+from yatube import metrics
+
+from . import cache
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS,
+                                       thread_name_prefix="thumbnails")
+    return _executor
+
+
+def supported_formats():
+    Image.init()
+    return [image_format for image_format in settings.IMAGE_VARIANT_FORMATS
+            if image_format.upper() in Image.SAVE]
+
+
+def variant_name(image_name, width, image_format):
+    digest = os.path.splitext(os.path.basename(image_name))[0]
+    return os.path.join("posts", "variants", f"{digest}_{width}.{image_format}").replace("\\", "/")
+
+
+def build_variants(image_file):
+    """Сохраняет варианты картинки с пропорциями карточки и возвращает их описание."""
+    card_width, card_height = (int(side) for side in settings.THUMBNAIL_SIZES["card"][0].split("x"))
+    image_file.open("rb")
+    with image_file, Image.open(image_file) as source:
+        source = source.convert("RGB")
+        variants = []
+        for width in settings.IMAGE_VARIANT_WIDTHS:
+            height = round(width * card_height / card_width)
+            resized = ImageOps.fit(source, (width, height), Image.LANCZOS)
+            for image_format in supported_formats():
+                name = variant_name(image_file.name, width, image_format)
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                buffer = BytesIO()
+                resized.save(buffer, image_format.upper(), quality=settings.IMAGE_VARIANT_QUALITY)
+                name = default_storage.save(name, ContentFile(buffer.getvalue()))
+                variants.append({"format": image_format, "width": width, "height": height,
+                                 "bytes": buffer.tell(), "url": default_storage.url(name)})
+    return variants
+
+
+def delete_files(image_name):
+    """Удаляет картинку, на которую больше не ссылается ни один пост, с миниатюрами и вариантами."""
+    image_file = Post(image=image_name).image
+    try:
+        delete(image_file)
+    except Exception:
+        logger.exception("Не удалось удалить миниатюры %s", image_name)
+    for width in settings.IMAGE_VARIANT_WIDTHS:
+        for image_format in settings.IMAGE_VARIANT_FORMATS:
+            default_storage.delete(variant_name(image_name, width, image_format))
+
+
+def generate(post_id, image_name):
+    """Готовит миниатюры поста, если картинка за это время не сменилась."""
+    try:
+        post = Post.objects.get(pk=post_id, image=image_name)
+        ready = (Post.objects.filter(image=image_name).exclude(pk=post_id).exclude(image_variants="")
+                 .values_list("thumbnails", "image_variants").first())
+        if ready:
+            urls, variants = json.loads(ready[0]), ready[1]
+        else:
+            start = time.perf_counter()
+            urls = {name: get_thumbnail(post.image, geometry, **options).url
+                    for name, (geometry, options) in settings.THUMBNAIL_SIZES.items()}
+            variants = json.dumps(build_variants(post.image))
+            metrics.THUMBNAIL_TIME.observe(time.perf_counter() - start)
+        updated = Post.objects.filter(pk=post_id, image=image_name).update(
+            thumbnails=json.dumps(urls), image_variants=variants, card_version=F("card_version") + 1)
+        if updated:
+            cache.invalidate(cache.FEED)
+        return urls
+    except Post.DoesNotExist:
+        return None
+    except Exception:
+        logger.exception("Не удалось подготовить миниатюры поста %s", post_id)
+        return None
+
+
+def _generate_in_worker(post_id, image_name):
+    try:
+        return generate(post_id, image_name)
+    finally:
+        connection.close()
+
+
+def schedule(post):
+    if not post.image:
+        return None
+    if not settings.THUMBNAIL_WORKERS:
+        return generate(post.pk, post.image.name)
+    return get_executor().submit(_generate_in_worker, post.pk, post.image.name)
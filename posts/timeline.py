@@ -0,0 +1,108 @@
+"""Лента подписок, материализованная в ``TimelineEntry``.
+
+Пост раскладывается по лентам подписчиков при публикации (fan-out on write).
+Посты авторов, у которых подписчиков не меньше ``TIMELINE_FANOUT_LIMIT``,
+не раскладываются, а подмешиваются при чтении ленты (fan-out on read), и
+счётчик ``AuthorStats.pending_fanout`` автора растёт. Когда после отписок
+автор опускается ниже порога, его посты продолжают подмешиваться, пока
+``rebuild_timelines --pending`` (по cron) не разложит их по лентам
+подписчиков - вне запроса, сколько бы их ни было.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Case, F, FilteredRelation, Q, When
+
+from .models import AuthorStats, Follow, Post, TimelineEntry, batched_by_pk
+from .paginator import FEED_KEYS
+
+BATCH_SIZE = 500
+# ключи курсора для ленты, читаемой по индексу TimelineEntry (user, pub_date, post)
+ENTRY_KEYS = ("feed_date", "feed_id")
+
+
+def _bulk_insert(entries):
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def is_heavy(author):
+    stats = AuthorStats.objects.for_author(author)
+    return stats.follower_count >= settings.TIMELINE_FANOUT_LIMIT
+
+
+def fan_out(post):
+    if is_heavy(post.author):
+        AuthorStats.objects.bump(post.author_id, pending_fanout=1)
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list("user_id", flat=True)
+    _bulk_insert(TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+                 for user_id in followers.iterator())
+
+
+def backfill(user_id, author):
+    if is_heavy(author):
+        return
+    _backfill_posts(user_id, author.pk)
+
+
+def _backfill_posts(user_id, author_id):
+    posts = Post.objects.filter(author_id=author_id).only("pk", "pub_date")
+    _bulk_insert(TimelineEntry(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+                 for batch in batched_by_pk(posts, BATCH_SIZE) for post in batch)
+
+
+def backfill_pending(author_ids=None):
+    """Раскладывает посты авторов ниже порога, у которых есть ``pending_fanout``.
+
+    Счётчик сбрасывается, только если за время раскладки не вырос, иначе
+    автор останется на следующий запуск. Возвращает число разобранных авторов.
+    """
+    pending = AuthorStats.objects.filter(pending_fanout__gt=0, follower_count__lt=settings.TIMELINE_FANOUT_LIMIT)
+    if author_ids is not None:
+        pending = pending.filter(author_id__in=author_ids)
+    done = 0
+    for author_id, count in list(pending.values_list("author_id", "pending_fanout")):
+        followers = Follow.objects.filter(author_id=author_id).only("pk", "user_id")
+        for batch in batched_by_pk(followers, BATCH_SIZE):
+            for follow in batch:
+                _backfill_posts(follow.user_id, author_id)
+        done += AuthorStats.objects.filter(author_id=author_id, pending_fanout=count).update(pending_fanout=0)
+    return done
+
+
+def remove(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, post__author_id=author_id).delete()
+
+
+def rebuild():
+    """Заново раскладывает посты по лентам всех подписок."""
+    TimelineEntry.objects.all().delete()
+    for follows in batched_by_pk(Follow.objects.select_related("author")):
+        for follow in follows:
+            backfill(follow.user_id, follow.author)
+    heavy = Q(follower_count__gte=settings.TIMELINE_FANOUT_LIMIT)
+    AuthorStats.objects.update(pending_fanout=Case(When(heavy, then=1), default=0))
+
+
+def follow_feed(user):
+    """Возвращает ``(post_list, keys)`` для ``paginate``.
+
+    Если среди подписок нет авторов с fan-out on read или с неразложенными
+    постами, лента читается одним проходом по индексу ``TimelineEntry``.
+    """
+    heavy = list(Follow.objects.filter(user=user).filter(
+        Q(author__stats__follower_count__gte=settings.TIMELINE_FANOUT_LIMIT) | Q(author__stats__pending_fanout__gt=0)
+    ).values_list("author_id", flat=True))
+    if heavy:
+        entries = TimelineEntry.objects.filter(user=user).values("post_id")
+        return Post.objects.for_feed().filter(Q(pk__in=entries) | Q(author__in=heavy)), FEED_KEYS
+    entry = FilteredRelation("timeline_entries", condition=Q(timeline_entries__user=user))
+    post_list = (Post.objects.for_feed().annotate(entry=entry)
+                 .annotate(feed_date=F("entry__pub_date"), feed_id=F("entry__post_id"))
+                 .filter(feed_id__isnull=False))
+    return post_list, ENTRY_KEYS
@@ -0,0 +1,101 @@
+"""Потоковая загрузка картинок постов.
+
+``PostImageUploadHandler`` принимает файл по частям: считает байты и
+обрывает загрузку, как только превышен ``IMAGE_UPLOAD_MAX_SIZE``, по
+первым килобайтам определяет формат и размеры картинки без декодирования
+пикселей и отбрасывает слишком большие по площади (декомпрессионные бомбы).
+Файл держится в памяти до ``IMAGE_UPLOAD_SPOOL_SIZE``, дальше пишется на диск.
+"""
+from functools import wraps
+from io import BytesIO
+
+from PIL import Image
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from yatube import metrics
+
+# сколько первых байт файла смотреть, чтобы узнать формат и размеры
+HEADER_LIMIT = 256 * 1024
+
+
+class PostImageUploadHandler(FileUploadHandler):
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.errors = getattr(request, "upload_errors", {})
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header = b""
+        self.image_info = None
+        self.file = BytesIO()
+        if self.content_length and self.content_length > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.reject(self.too_large_message())
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.reject(self.too_large_message())
+        if self.image_info is None:
+            self.sniff(raw_data)
+        self.write(raw_data)
+
+    def file_complete(self, file_size):
+        metrics.UPLOAD_SIZE.observe(file_size)
+        self.file.seek(0)
+        if isinstance(self.file, TemporaryUploadedFile):
+            self.file.size = file_size
+            return self.file
+        return InMemoryUploadedFile(self.file, self.field_name, self.file_name, self.content_type,
+                                    file_size, self.charset, self.content_type_extra)
+
+    def sniff(self, raw_data):
+        if len(self.header) >= HEADER_LIMIT:
+            self.reject("Не удалось распознать изображение.")
+        self.header += raw_data[:HEADER_LIMIT - len(self.header)]
+        try:
+            with Image.open(BytesIO(self.header)) as image:
+                self.image_info = (image.format, image.size)
+        except Image.DecompressionBombError:
+            self.reject("Изображение слишком большое по площади.")
+        except Exception:
+            return
+        width, height = self.image_info[1]
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            self.reject("Изображение слишком большое по площади.")
+        self.header = b""
+
+    def write(self, raw_data):
+        if isinstance(self.file, BytesIO) and self.file.tell() + len(raw_data) > settings.IMAGE_UPLOAD_SPOOL_SIZE:
+            spooled = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset,
+                                            self.content_type_extra)
+            spooled.write(self.file.getvalue())
+            self.file = spooled
+        self.file.write(raw_data)
+
+    def reject(self, message):
+        self.file.close()
+        self.errors[self.field_name] = message
+        raise SkipFile()
+
+    def too_large_message(self):
+        return f"Файл больше {filesizeformat(settings.IMAGE_UPLOAD_MAX_SIZE)}."
+
+
+def stream_image_uploads(view):
+    """Подключает ``PostImageUploadHandler`` к view с формой поста.
+
+    Обработчики загрузки можно сменить только до чтения ``request.POST``,
+    а проверка CSRF в middleware его читает, поэтому она переносится внутрь.
+    Ошибки загрузки передаются форме через ``request.upload_errors``.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_errors = {}
+        request.upload_handlers = [PostImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return wrapper
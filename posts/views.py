@@ -1,71 +1,102 @@
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404, redirect
+from django.utils.http import urlencode
+from yatube.db_router import read_from_replica
 
-from .models import Comment, Follow, Post, Group, User
+from . import search as search_index, thumbnails, timeline
+from .cache import anonymous_page_cache
+from .models import AuthorStats, Follow, Post, Group, User
 from .forms import PostForm, CommentForm
+from .paginator import paginate
+from .uploads import stream_image_uploads
 
 
+def is_following(user, author):
+    return user.is_authenticated and Follow.objects.filter(user=user, author=author).exists()
+
+
+@read_from_replica
+@anonymous_page_cache
 def index(request):
-    post_list = Post.objects.select_related("author", "group").all()
+    post_list = Post.objects.for_feed()
 
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    page, paginator = paginate(request, post_list, 10)
 
     return render(request, "index.html", {"page": page, "paginator": paginator})
 
 
+@read_from_replica
+@anonymous_page_cache
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
+    post_list = group.posts.for_feed()
 
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    page, paginator = paginate(request, post_list, 10)
 
     return render(request, "group.html", {"group": group, "page": page, "paginator": paginator})
 
 
+@read_from_replica
+@anonymous_page_cache
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = Post.objects.filter(author=author).all()
+    author = get_object_or_404(User.objects.select_related("stats"), username=username)
+    stats = AuthorStats.objects.for_author(author)
+    post_list = Post.objects.for_feed().filter(author=author)
 
-    paginator = Paginator(post_list, 5)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    page, paginator = paginate(request, post_list, 5)
 
-    return render(request, "profile.html", {"author": author, "page": page, "paginator": paginator})
+    return render(request, "profile.html", {"author": author, "stats": stats, "page": page, "paginator": paginator,
+                                            "is_following": is_following(request.user, author)})
 
 
+def search(request):
+    query = request.GET.get("q", "").strip()
+    paginator = Paginator(search_index.SearchResults(query), 10)
+    page = paginator.get_page(request.GET.get("page"))
+    return render(request, "search.html", {"query": query, "page": page, "paginator": paginator,
+                                           "extra": urlencode({"q": query}) + "&"})
+
+
+@read_from_replica
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, author__username=username, id=post_id)
-    comments = Comment.objects.filter(post=post)
+    post = get_object_or_404(Post.objects.select_related("author__stats", "group"),
+                             author__username=username, id=post_id)
+    stats = AuthorStats.objects.for_author(post.author)
+    comments = post.comments.select_related("author").order_by("created")
     form = CommentForm()
-    return render(request, "post.html", {"author": post.author, "post": post, "items": comments, "form": form})
+    return render(request, "post.html", {"author": post.author, "stats": stats, "post": post,
+                                         "items": comments, "form": form,
+                                         "is_following": is_following(request.user, post.author)})
 
 
 @login_required
+@stream_image_uploads
 def new_post(request):
-    form = PostForm(request.POST or None, files=request.FILES or None)
+    form = PostForm(request.POST or None, files=request.FILES or None, upload_errors=request.upload_errors)
     if request.method == "POST":
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            thumbnails.schedule(post)
             return redirect("index")
     return render(request, "new_post.html", {"form": form, "post": None})
 
 
 @login_required
+@stream_image_uploads
 def post_edit(request, username, post_id):
     post = get_object_or_404(Post, author__username=username, id=post_id)
 
     if request.user == post.author:
-        form = PostForm(request.POST or None, instance=post, files=request.FILES or None)
+        form = PostForm(request.POST or None, instance=post, files=request.FILES or None,
+                        upload_errors=request.upload_errors)
         if request.method == "POST":
             if form.is_valid():
                 form.edit()
+                if "image" in form.changed_data:
+                    thumbnails.schedule(post)
                 return redirect("post", post.author, post_id)
         return render(request, "new_post.html", {"form": form, "post": post})
     return redirect("post", post.author, post_id)
@@ -85,13 +116,12 @@ def add_comment(request, username, post_id):
     return redirect("post", post.author, post_id)
 
 
+@read_from_replica
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
+    post_list, keys = timeline.follow_feed(request.user)
 
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    page, paginator = paginate(request, post_list, 10, keys=keys)
     return render(request, "follow.html", {"page": page, "paginator": paginator})
 
 
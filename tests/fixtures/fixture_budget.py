@@ -0,0 +1,83 @@
+"""Бюджеты числа SQL-запросов и времени SQL на каждое имя URL.
+
+Фикстура ``query_budget`` - контекстный менеджер: всё, что выполнено внутри
+``with query_budget("index"):``, сравнивается с записью ``index`` в
+``tests/query_budgets.json``. При превышении тест падает со списком запросов.
+``pytest --update-query-budgets`` вместо проверки записывает в файл текущие
+значения: число запросов как есть, время SQL - с запасом ``SQL_MS_HEADROOM``.
+"""
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+
+import pytest
+
+BUDGETS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "query_budgets.json")
+# во сколько раз бюджет времени SQL больше замера и меньше какого значения он не бывает
+SQL_MS_HEADROOM = 4
+SQL_MS_MIN = 25
+
+
+def pytest_addoption(parser):
+    parser.addoption("--update-query-budgets", action="store_true",
+                     help="записать текущие число запросов и время SQL в tests/query_budgets.json")
+
+
+class QueryBudgets:
+    def __init__(self, update):
+        self.update = update
+        self.measured = {}
+        with open(BUDGETS_FILE, encoding="utf-8") as stream:
+            self.budgets = json.load(stream)
+
+    @contextmanager
+    def __call__(self, url_name):
+        from django.db import connection
+
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append((sql, (time.perf_counter() - start) * 1000))
+
+        with connection.execute_wrapper(record):
+            yield queries
+        sql_ms = sum(duration for _, duration in queries)
+        if self.update:
+            count, time_ms = self.measured.get(url_name, (0, 0))
+            self.measured[url_name] = (max(count, len(queries)), max(time_ms, sql_ms))
+            return
+        budget = self.budgets.get(url_name)
+        if budget is None:
+            pytest.fail(f"Нет бюджета запросов для {url_name}: запустите pytest --update-query-budgets")
+        if len(queries) > budget["queries"] or sql_ms > budget["sql_ms"]:
+            statements = "\n".join(f"  {i}. [{duration:.2f} мс] {sql}"
+                                   for i, (sql, duration) in enumerate(queries, 1))
+            pytest.fail(f"{url_name}: {len(queries)} запросов за {sql_ms:.2f} мс, бюджет {budget['queries']} "
+                        f"запросов и {budget['sql_ms']} мс\n{statements}")
+
+    def save(self):
+        for url_name, (count, sql_ms) in self.measured.items():
+            self.budgets[url_name] = {"queries": count,
+                                      "sql_ms": max(math.ceil(sql_ms * SQL_MS_HEADROOM), SQL_MS_MIN)}
+        with open(BUDGETS_FILE, "w", encoding="utf-8") as stream:
+            json.dump(dict(sorted(self.budgets.items())), stream, indent=4)
+            stream.write("\n")
+
+
+@pytest.fixture(scope="session")
+def query_budgets(request):
+    budgets = QueryBudgets(request.config.getoption("--update-query-budgets"))
+    yield budgets
+    if budgets.update:
+        budgets.save()
+
+
+@pytest.fixture
+def query_budget(query_budgets):
+    return query_budgets
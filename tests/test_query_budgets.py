@@ -0,0 +1,81 @@
+import json
+
+import pytest
+from django.urls import reverse
+
+from tests.fixtures.fixture_budget import BUDGETS_FILE
+
+
+@pytest.fixture
+def feed(user, django_user_model):
+    from posts.models import Comment, Follow, Group, Post
+    author = django_user_model.objects.create_user(username='BudgetAuthor', password='1234567')
+    group = Group.objects.create(title='Бюджетная группа', slug='budget', description='Описание')
+    posts = [Post.objects.create(text=f'Бюджетный пост {i}', author=author, group=group) for i in range(15)]
+    for post in posts:
+        Comment.objects.create(post=post, author=user, text='Бюджетный комментарий')
+    Follow.objects.create(user=user, author=author)
+    return author, group, posts[-1]
+
+
+@pytest.fixture
+def author_client(feed, client):
+    client.force_login(feed[0])
+    return client
+
+
+def feed_urls(feed):
+    author, group, post = feed
+    return {
+        'index': reverse('index'),
+        'group_posts': reverse('group_posts', args=[group.slug]),
+        'search': reverse('search') + '?q=бюджетный',
+        'profile': reverse('profile', args=[author.username]),
+        'post': reverse('post', args=[author.username, post.id]),
+        'follow_index': reverse('follow_index'),
+        'new_post': reverse('new_post'),
+    }
+
+
+class TestQueryBudgets:
+
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.parametrize('url_name', ['index', 'group_posts', 'search', 'profile', 'post', 'follow_index',
+                                          'new_post'])
+    def test_page(self, url_name, feed, user_client, query_budget):
+        url = feed_urls(feed)[url_name]
+        with query_budget(url_name):
+            response = user_client.get(url)
+        assert response.status_code == 200, f'Страница `{url}` не открывается'
+
+    @pytest.mark.django_db(transaction=True)
+    def test_post_edit(self, feed, author_client, query_budget):
+        author, _, post = feed
+        with query_budget('post_edit'):
+            response = author_client.get(reverse('post_edit', args=[author.username, post.id]))
+        assert response.status_code == 200
+
+    @pytest.mark.django_db(transaction=True)
+    def test_add_comment(self, feed, user_client, query_budget):
+        author, _, post = feed
+        with query_budget('add_comment'):
+            response = user_client.post(reverse('add_comment', args=[author.username, post.id]),
+                                        data={'text': 'Новый комментарий'})
+        assert response.status_code == 302
+
+    @pytest.mark.django_db(transaction=True)
+    def test_follow_unfollow(self, feed, user_client, query_budget):
+        author = feed[0]
+        with query_budget('profile_unfollow'):
+            assert user_client.get(reverse('profile_unfollow', args=[author.username])).status_code == 302
+        with query_budget('profile_follow'):
+            assert user_client.get(reverse('profile_follow', args=[author.username])).status_code == 302
+
+    def test_every_url_has_budget(self, request):
+        if request.config.getoption('--update-query-budgets'):
+            pytest.skip('бюджеты как раз обновляются')
+        from posts.urls import urlpatterns
+        with open(BUDGETS_FILE, encoding='utf-8') as stream:
+            budgets = json.load(stream)
+        missing = {pattern.name for pattern in urlpatterns} - set(budgets)
+        assert not missing, f'Нет бюджета запросов для {", ".join(sorted(missing))}'
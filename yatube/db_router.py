@@ -0,0 +1,91 @@
+"""Чтение лент с реплик, запись в основную базу.
+
+View, обёрнутые в ``read_from_replica``, читают из одной из баз
+``DATABASE_REPLICAS`` (одной на весь запрос); всё остальное, как и любая
+запись, идёт в ``default``. Реплика может отставать, поэтому после записи
+пользователь получает cookie, и ``REPLICA_PIN_SECONDS`` секунд все его
+запросы читают из ``default`` - он сразу видит свой пост или комментарий.
+"""
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = "db_pin"
+
+_current = ContextVar("db_routing", default=None)
+
+
+class Routing:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.replica_allowed = False
+        self.replica = None
+        self.wrote = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _current.get()
+        if routing is None or not routing.replica_allowed or routing.pinned or routing.wrote:
+            return None
+        if routing.replica is None and settings.DATABASE_REPLICAS:
+            routing.replica = random.choice(settings.DATABASE_REPLICAS)
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _current.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Реплики получают схему вместе с данными, миграции идут только в основную базу."""
+        return db not in settings.DATABASE_REPLICAS
+
+
+def pinned_until(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0))
+    except ValueError:
+        return 0
+
+
+class ReplicaPinMiddleware:
+    """Ставит cookie после запросов с записью и читает его в следующих."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routing = Routing(pinned=pinned_until(request) > time.time())
+        token = _current.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        if routing.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(PIN_COOKIE, f"{time.time() + settings.REPLICA_PIN_SECONDS:.3f}",
+                                max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite="Lax")
+        return response
+
+
+def read_from_replica(view):
+    """Разрешает view читать с реплики, если пользователь ничего не писал недавно."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        routing = _current.get()
+        if routing is None:
+            return view(request, *args, **kwargs)
+        routing.replica_allowed = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            routing.replica_allowed = False
+    return wrapper
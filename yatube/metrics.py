@@ -0,0 +1,222 @@
+"""Метрики в формате Prometheus для ``/metrics``.
+
+Каждый процесс (воркер gunicorn) копит значения в памяти и сбрасывает их
+в свой файл ``<pid>.json`` в каталоге ``METRICS_DIR`` - не чаще раза в
+``METRICS_FLUSH_INTERVAL`` секунд из фонового потока и при выходе. Страница
+``/metrics`` складывает файлы всех процессов, поэтому её может отдать любой
+воркер. Файлы завершившихся процессов остаются, и счётчики не убывают.
+"""
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import suppress
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        # запись файла процесса: одна за раз, чтобы старый снимок не лёг поверх нового
+        self.file_lock = threading.Lock()
+        self.pid = None
+        self.values = {}
+        self.dirty = False
+        self.flusher = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def path(self, pid=None):
+        return os.path.join(settings.METRICS_DIR, f"{pid or os.getpid()}.json")
+
+    def ensure_process(self):
+        """После fork начинает с файла своего pid, а не со значений родителя."""
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.values = read(self.path())
+        self.dirty = False
+        self.flusher = None
+        self.file_lock = threading.Lock()
+
+    def add(self, key, size, amounts):
+        """Прибавляет ``amounts`` (``{индекс: величина}``) к строке значений ``key`` длины ``size``."""
+        with self.lock:
+            self.ensure_process()
+            row = self.values.setdefault(key, [0] * size)
+            for index, amount in amounts.items():
+                row[index] += amount
+            self.dirty = True
+        if settings.METRICS_FLUSH_INTERVAL <= 0:
+            self.flush()
+        elif self.flusher is None:
+            self.start_flusher()
+
+    def start_flusher(self):
+        with self.lock:
+            if self.flusher is not None:
+                return
+            self.flusher = threading.Thread(target=self.flush_periodically, name="metrics", daemon=True)
+        self.flusher.start()
+
+    def flush_periodically(self):
+        pid = os.getpid()
+        while self.pid == pid:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """Пишет значения в ``<pid>.json`` через свой временный файл и ``os.replace``."""
+        with self.file_lock:
+            with self.lock:
+                if not self.dirty or self.pid != os.getpid():
+                    return
+                data = json.dumps(self.values)
+                self.dirty = False
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(prefix=f"{self.pid}.", suffix=".json.tmp",
+                                                     dir=settings.METRICS_DIR)
+            try:
+                with os.fdopen(descriptor, "w") as stream:
+                    stream.write(data)
+                os.replace(temporary, self.path())
+            except BaseException:
+                with self.lock:
+                    self.dirty = True
+                with suppress(OSError):
+                    os.unlink(temporary)
+                raise
+
+    def collect(self):
+        """Сумма значений всех процессов: ``{ключ: [значения]}``."""
+        self.flush()
+        total = {}
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, "*.json")):
+            for key, row in read(path).items():
+                if key in total:
+                    total[key] = [a + b for a, b in zip(total[key], row)]
+                else:
+                    total[key] = row
+        return total
+
+    def render(self):
+        samples = {}
+        for key, row in self.collect().items():
+            name, labels = json.loads(key)
+            samples.setdefault(name, []).append((labels, row))
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, row in sorted(samples.get(name, ()), key=lambda sample: sorted(sample[0].items())):
+                lines.extend(metric.expose(labels, row))
+        hits = sum(row[0] for labels, row in samples.get(CACHE_REQUESTS.name, ()) if labels["result"] == "hit")
+        lookups = sum(row[0] for labels, row in samples.get(CACHE_REQUESTS.name, ()))
+        lines.append("# HELP yatube_cache_hit_ratio Доля попаданий среди чтений из кэша.")
+        lines.append("# TYPE yatube_cache_hit_ratio gauge")
+        lines.append(f"yatube_cache_hit_ratio {number(hits / lookups if lookups else 0)}")
+        return "\n".join(lines) + "\n"
+
+
+def read(path):
+    try:
+        with open(path) as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return {}
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join('{}="{}"'.format(name, str(value).replace("\\", r"\\").replace('"', r"\"")
+                                      .replace("\n", r"\n")) for name, value in sorted(labels.items()))
+    return "{" + pairs + "}"
+
+
+def number(value):
+    return repr(float(value))
+
+
+def metric_key(name, labels):
+    return json.dumps([name, labels], sort_keys=True)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+
+    def inc(self, amount=1, **labels):
+        registry.add(metric_key(self.name, labels), 1, {0: amount})
+
+    def expose(self, labels, row):
+        yield f"{self.name}{format_labels(labels)} {number(row[0])}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """Строка значений: счётчики корзин (не накопленные), +Inf, сумма и число наблюдений."""
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        size = len(self.buckets) + 3
+        registry.add(metric_key(self.name, labels), size, {index: 1, size - 2: value, size - 1: 1})
+
+    def expose(self, labels, row):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), row):
+            cumulative += count
+            le = bound if bound == "+Inf" else number(bound)
+            yield f"{self.name}_bucket{format_labels({**labels, 'le': le})} {number(cumulative)}"
+        yield f"{self.name}_sum{format_labels(labels)} {number(row[-2])}"
+        yield f"{self.name}_count{format_labels(labels)} {number(row[-1])}"
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+REQUEST_LATENCY = registry.register(Histogram(
+    "yatube_request_duration_seconds", "Время ответа по имени URL.",
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)))
+DB_QUERIES = registry.register(Counter("yatube_db_queries_total", "SQL-запросы по имени URL."))
+CACHE_REQUESTS = registry.register(Counter("yatube_cache_requests_total", "Чтения из кэша: hit или miss."))
+THUMBNAIL_TIME = registry.register(Histogram(
+    "yatube_thumbnail_generation_seconds", "Время подготовки миниатюр и вариантов картинки.",
+    (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)))
+UPLOAD_SIZE = registry.register(Histogram(
+    "yatube_upload_size_bytes", "Размер загруженных картинок постов.",
+    (10 * 1024, 100 * 1024, 500 * 1024, 1024 ** 2, 2.5 * 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2)))
+
+
+def record_request(view, duration, queries, hits, misses):
+    REQUEST_LATENCY.observe(duration, view=view)
+    if queries:
+        DB_QUERIES.inc(queries, view=view)
+    if hits:
+        CACHE_REQUESTS.inc(hits, result="hit")
+    if misses:
+        CACHE_REQUESTS.inc(misses, result="miss")
+
+
+def view(request):
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
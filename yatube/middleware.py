@@ -0,0 +1,181 @@
+"""Замер запросов: SQL, шаблоны и кэш, заголовок ``Server-Timing``.
+
+``ServerTimingMiddleware`` считает для каждого запроса число и время
+SQL-запросов (через ``execute_wrapper``, так что ``DEBUG`` не нужен), время
+отрисовки шаблонов - общее и по каждому шаблону, включая ``{% include %}``,
+и попадания и промахи кэша. Итог уходит в заголовок ``Server-Timing``: всё
+целиком - сотрудникам и адресам из ``INTERNAL_IPS``, остальным только
+``total``, чтобы не раскрывать устройство страниц и состояние кэша.
+Доля ``SERVER_TIMING_SAMPLE_RATE`` запросов пишется JSON-строкой в логгер
+``yatube.timing`` (в настройках он пишет в файл с ротацией). Те же числа
+копятся в метриках для ``/metrics`` (см. ``yatube.metrics``), а запросы к
+базе дольше ``SLOW_QUERY_THRESHOLD_MS`` - в журнале ``yatube.slow_queries``.
+
+Шаблоны и кэш замеряются обёртками ``Template.render`` и ``get`` бэкендов
+кэша; они ставятся один раз при создании middleware и вне запроса ничего
+не делают.
+"""
+import json
+import logging
+import random
+import re
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.base import Template
+
+from . import metrics, slow_queries
+
+logger = logging.getLogger("yatube.timing")
+
+_current = ContextVar("server_timing", default=None)
+_MISSING = object()
+
+
+class Timing:
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.templates = {}
+        self.render = 0.0
+        self.depth = 0
+        self.hits = 0
+        self.misses = 0
+        self.slow = []
+
+    def header(self, total, detailed=True):
+        if not detailed:
+            return f"total;dur={total * 1000:.2f}"
+        parts = [f'sql;dur={self.sql * 1000:.2f};desc="{self.queries} queries"',
+                 f"tpl;dur={self.render * 1000:.2f}"]
+        for name, (count, duration) in sorted(self.templates.items(), key=lambda item: -item[1][1]):
+            parts.append(f'tpl-{re.sub(r"[^A-Za-z0-9_.-]", "-", name)};dur={duration * 1000:.2f};desc="{count}x"')
+        parts.append(f'cache;desc="hit={self.hits} miss={self.misses}"')
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+    def as_dict(self, request, response, total):
+        return {
+            "path": request.path,
+            "view": getattr(request.resolver_match, "view_name", None),
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 2),
+            "queries": self.queries,
+            "sql_ms": round(self.sql * 1000, 2),
+            "render_ms": round(self.render * 1000, 2),
+            "templates": {name: {"count": count, "ms": round(duration * 1000, 2)}
+                          for name, (count, duration) in self.templates.items()},
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+        }
+
+
+def _record_sql(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        timing.queries += 1
+        timing.sql += duration
+        if 0 <= settings.SLOW_QUERY_THRESHOLD_MS <= duration * 1000:
+            timing.slow.append(slow_queries.capture(sql, params, many, duration, context["connection"].alias))
+
+
+def _timed_render(render):
+    def wrapper(self, context):
+        timing = _current.get()
+        if timing is None:
+            return render(self, context)
+        timing.depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            duration = time.perf_counter() - start
+            timing.depth -= 1
+            if not timing.depth:
+                timing.render += duration
+            name = self.origin.template_name or self.name or "<string>"
+            count, total = timing.templates.get(name, (0, 0.0))
+            timing.templates[name] = (count + 1, total + duration)
+    wrapper.timed = True
+    return wrapper
+
+
+def _counted_get(get):
+    def wrapper(self, key, default=None, version=None):
+        value = get(self, key, _MISSING, version=version)
+        timing = _current.get()
+        if timing is not None:
+            if value is _MISSING:
+                timing.misses += 1
+            else:
+                timing.hits += 1
+        return default if value is _MISSING else value
+    wrapper.timed = True
+    return wrapper
+
+
+def instrument():
+    """Ставит обёртки отрисовки шаблонов и чтения из кэша (один раз)."""
+    if not getattr(Template.render, "timed", False):
+        Template.render = _timed_render(Template.render)
+    for alias in settings.CACHES:
+        backend = type(caches[alias])
+        if not getattr(backend.get, "timed", False):
+            backend.get = _counted_get(backend.get)
+
+
+def show_details(request):
+    """Подробный заголовок - для ``INTERNAL_IPS`` и сотрудников.
+
+    Без cookie сессии пользователь анонимен, и сессия не загружается.
+    """
+    if request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS:
+        return True
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return False
+    user = getattr(request, "user", None)
+    return user is not None and user.is_staff
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument()
+
+    def __call__(self, request):
+        timing = Timing()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_record_sql))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+        response["Server-Timing"] = timing.header(total, detailed=show_details(request))
+        match = request.resolver_match
+        try:
+            metrics.record_request(match.view_name if match else "unmatched", total, timing.queries,
+                                   timing.hits, timing.misses)
+        except OSError:
+            logger.exception("Не удалось записать метрики")
+        if timing.slow:
+            try:
+                slow_queries.submit(timing.slow, request)
+            except Exception:
+                logger.exception("Не удалось записать медленные запросы")
+        if random.random() < settings.SERVER_TIMING_SAMPLE_RATE:
+            logger.info(json.dumps(timing.as_dict(request, response, total), ensure_ascii=False))
+        return response
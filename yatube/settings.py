@@ -50,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.middleware.ServerTimingMiddleware',
+    'yatube.db_router.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -89,13 +91,49 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# PRAGMA выполняются при открытии каждого соединения (см. yatube/sqlite3/base.py),
+# активные значения показывает ``python manage.py check --tag database``.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "wal"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "normal"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000)),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -64000)),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "memory"),
+}
+
+# Соединение с базой живёт до DATABASE_CONN_MAX_AGE секунд (0 - новое на каждый запрос) и перед
+# повторным использованием проверяется, если DATABASE_CONN_HEALTH_CHECKS = 1.
+DATABASE_CONN_MAX_AGE = int(os.getenv("DATABASE_CONN_MAX_AGE", 60))
+DATABASE_CONN_HEALTH_CHECKS = os.getenv("DATABASE_CONN_HEALTH_CHECKS", "1") == "1"
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'ENGINE': 'yatube.sqlite3',
+        'NAME': os.getenv("DATABASE_NAME", os.path.join(BASE_DIR, 'db.sqlite3')),
+        'PRAGMAS': SQLITE_PRAGMAS,
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DATABASE_CONN_HEALTH_CHECKS,
     }
 }
 
+# Реплики только для чтения (yatube/db_router.py): пути к файлам SQLite через запятую.
+# С них читают ленты и страница поста; после записи пользователь REPLICA_PIN_SECONDS
+# секунд читает только из default, чтобы сразу видеть свои изменения.
+DATABASE_REPLICAS = []
+for number, name in enumerate(filter(None, os.getenv("DATABASE_REPLICAS", "").split(",")), 1):
+    DATABASES[f"replica{number}"] = {
+        'ENGINE': 'yatube.sqlite3',
+        'NAME': name,
+        'PRAGMAS': {**SQLITE_PRAGMAS, "query_only": 1},
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DATABASE_CONN_HEALTH_CHECKS,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f"replica{number}")
+DATABASE_ROUTERS = ["yatube.db_router.ReplicaRouter"]
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -149,8 +187,98 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 SITE_ID = 1
 
+# Общий для всех воркеров кэш выбирается переменной окружения CACHE_BACKEND:
+# locmem (по умолчанию, у каждого процесса свой), file, memcached, redis.
+# Для file CACHE_LOCATION - каталог, для memcached/redis - адрес сервера.
+# memcached требует python-memcached, redis - django-redis.
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "memcached": "django.core.cache.backends.memcached.MemcachedCache",
+    "redis": "django_redis.cache.RedisCache",
+}
+
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        "BACKEND": CACHE_BACKENDS[os.getenv("CACHE_BACKEND", "locmem")],
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+        "KEY_PREFIX": os.getenv("CACHE_KEY_PREFIX", "yatube"),
     }
 }
+
+# Считать ли общее число постов (COUNT(*)) на курсорных страницах ленты.
+# Без подсчёта номера страниц не выводятся, остаются ссылки «Предыдущая/Следующая».
+POSTS_PAGINATOR_COUNT = os.getenv("POSTS_PAGINATOR_COUNT", "1") == "1"
+
+# Посты авторов, у которых подписчиков не меньше этого числа, не раскладываются
+# по лентам подписчиков при публикации, а подмешиваются при чтении /follow/.
+TIMELINE_FANOUT_LIMIT = int(os.getenv("TIMELINE_FANOUT_LIMIT", 1000))
+
+# Сколько секунд хранить целиком страницы лент для анонимных посетителей (0 - не кэшировать).
+PAGE_CACHE_TIMEOUT = int(os.getenv("PAGE_CACHE_TIMEOUT", 300))
+
+# Размеры миниатюр, которые готовятся в фоне после загрузки картинки поста:
+# имя -> (геометрия sorl, опции). THUMBNAIL_WORKERS = 0 - готовить сразу в запросе.
+THUMBNAIL_SIZES = {
+    "card": ("960x339", {"crop": "center", "upscale": True}),
+}
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", 2))
+
+# Варианты картинки поста для srcset: ширины и форматы, от самого компактного.
+# Форматы, которые не умеет сохранять установленный Pillow (avif без плагина), пропускаются.
+IMAGE_VARIANT_WIDTHS = (480, 960)
+IMAGE_VARIANT_FORMATS = ("avif", "webp", "jpeg")
+IMAGE_VARIANT_QUALITY = 80
+
+# Ограничения загрузки картинок постов (posts/uploads.py): размер файла в байтах,
+# площадь в пикселях и размер, после которого файл пишется во временный файл на диске.
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv("IMAGE_UPLOAD_MAX_SIZE", 10 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv("IMAGE_UPLOAD_MAX_PIXELS", 40 * 1000 * 1000))
+IMAGE_UPLOAD_SPOOL_SIZE = int(os.getenv("IMAGE_UPLOAD_SPOOL_SIZE", 512 * 1024))
+
+# Замер запросов (yatube/middleware.py): заголовок Server-Timing отдаётся всегда,
+# а доля SERVER_TIMING_SAMPLE_RATE запросов пишется в журнал с ротацией.
+SERVER_TIMING_SAMPLE_RATE = float(os.getenv("SERVER_TIMING_SAMPLE_RATE", 0.01))
+SERVER_TIMING_LOG = os.getenv("SERVER_TIMING_LOG", os.path.join(BASE_DIR, "timing.log"))
+
+# Журнал медленных запросов (yatube/slow_queries.py): запросы к базе дольше порога
+# в миллисекундах (отрицательный порог - выключить) пишутся с планом EXPLAIN, который
+# строится в SLOW_QUERY_WORKERS фоновых потоках (0 - сразу), и стеком из кода проекта.
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 100))
+SLOW_QUERY_WORKERS = int(os.getenv("SLOW_QUERY_WORKERS", 1))
+SLOW_QUERY_STACK_DEPTH = int(os.getenv("SLOW_QUERY_STACK_DEPTH", 8))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", os.path.join(BASE_DIR, "slow_queries.log"))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "timing": {
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": SERVER_TIMING_LOG,
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            "delay": True,
+            "encoding": "utf-8",
+        },
+        "slow_queries": {
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": SLOW_QUERY_LOG,
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            "delay": True,
+            "encoding": "utf-8",
+        },
+    },
+    "loggers": {
+        "yatube.timing": {"handlers": ["timing"], "level": "INFO", "propagate": False},
+        "yatube.slow_queries": {"handlers": ["slow_queries"], "level": "INFO", "propagate": False},
+    },
+}
+
+# Метрики Prometheus на /metrics (yatube/metrics.py): каждый процесс сбрасывает свои
+# значения в файл в METRICS_DIR не реже раза в METRICS_FLUSH_INTERVAL секунд
+# (0 - после каждого изменения), страница складывает файлы всех процессов.
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(BASE_DIR, "metrics"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 1))
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1").split(",")
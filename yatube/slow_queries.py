@@ -0,0 +1,145 @@
+"""Журнал медленных SQL-запросов с планами выполнения.
+
+``ServerTimingMiddleware`` замеряет каждый запрос к базе; те, что идут
+дольше ``SLOW_QUERY_THRESHOLD_MS``, попадают сюда вместе с коротким стеком
+вызовов из кода проекта. После ответа к ним добавляются имя view и id
+пользователя, план ``EXPLAIN QUERY PLAN`` строится в фоновом потоке
+(``SLOW_QUERY_WORKERS = 0`` - сразу, в том же запросе), и запись JSON-строкой
+уходит в логгер ``yatube.slow_queries`` (в настройках - файл с ротацией).
+План строится один раз на форму запроса - SQL без конкретных значений.
+В журнал пишется только форма: параметры и литералы (ключи сессий, хэши
+паролей) нужны лишь для ``EXPLAIN`` и остаются в памяти.
+"""
+import json
+import logging
+import os
+import re
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger("yatube.slow_queries")
+
+SQL_LIMIT = 2000
+EXPLAINED = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+# сколько форм запросов держать с готовыми планами
+PLAN_CACHE_SIZE = 256
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LISTS = re.compile(r"\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)")
+
+_executor = None
+_plans = {}
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.SLOW_QUERY_WORKERS, thread_name_prefix="slow_queries")
+    return _executor
+
+
+def shape(sql):
+    """SQL без значений: литералы и списки параметров заменены на ``?``."""
+    sql = LITERALS.sub("?", sql)
+    sql = PLACEHOLDER_LISTS.sub("(...)", sql)
+    return " ".join(sql.replace("%s", "?").split())
+
+
+def project_stack():
+    """Последние ``SLOW_QUERY_STACK_DEPTH`` кадров стека из кода проекта."""
+    frames = []
+    for frame in traceback.extract_stack()[:-2]:
+        path = os.path.relpath(frame.filename, settings.BASE_DIR)
+        if path.startswith("..") or "site-packages" in path or path.startswith(("yatube/middleware", "yatube/slow")):
+            continue
+        frames.append(f"{path}:{frame.lineno} in {frame.name}")
+    return frames[-settings.SLOW_QUERY_STACK_DEPTH:]
+
+
+def capture(sql, params, many, duration, alias):
+    """Запоминает медленный запрос; зовётся из обёртки ``execute``.
+
+    ``sql`` и ``params`` нужны только для плана, ``write`` их в журнал не пишет.
+    """
+    if many:
+        # у executemany берутся параметры первой строки, если это список
+        params = params[0] if isinstance(params, (list, tuple)) and params else None
+    return {
+        "sql": sql,
+        "params": params,
+        "alias": alias,
+        "duration_ms": round(duration * 1000, 2),
+        "stack": project_stack(),
+    }
+
+
+def submit(queries, request):
+    """Дописывает к запросам сведения о запросе и отправляет их в журнал."""
+    user = getattr(request, "user", None)
+    match = request.resolver_match
+    context = {
+        "time": timezone.now().isoformat(),
+        "path": request.path,
+        "view": match.view_name if match else None,
+        "user_id": user.pk if user is not None and user.is_authenticated else None,
+    }
+    entries = [{**context, **query} for query in queries]
+    if not settings.SLOW_QUERY_WORKERS:
+        return write(entries)
+    return get_executor().submit(_write_in_worker, entries)
+
+
+def explain(sql, params, alias):
+    """План запроса; ``execute_wrapper`` в обход, чтобы не замерять сам EXPLAIN."""
+    if not sql.lstrip().upper().startswith(EXPLAINED):
+        return []
+    connection = connections[alias]
+    connection.ensure_connection()
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+        return [str(row[-1]) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def write(entries):
+    for entry in entries:
+        sql, params = entry.pop("sql"), entry.pop("params")
+        form = shape(sql)
+        if form not in _plans:
+            if len(_plans) >= PLAN_CACHE_SIZE:
+                _plans.clear()
+            try:
+                _plans[form] = explain(sql, params, entry["alias"])
+            except Exception as error:
+                _plans[form] = [f"EXPLAIN не удался: {error}"]
+        entry["shape"] = form[:SQL_LIMIT]
+        entry["plan"] = _plans[form]
+        logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+def _write_in_worker(entries):
+    try:
+        write(entries)
+    except Exception:
+        logger.exception("Не удалось записать медленные запросы")
+    finally:
+        for alias in {entry["alias"] for entry in entries}:
+            connections[alias].close()
+
+
+def read(path):
+    """Записи журнала и его архивов (``path``, ``path.1``, ...), от старых к новым."""
+    paths = [path] + [f"{path}.{number}" for number in range(1, 100)]
+    for name in reversed([name for name in paths if os.path.exists(name)]):
+        with open(name, encoding="utf-8") as stream:
+            for line in stream:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
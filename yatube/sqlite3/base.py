@@ -0,0 +1,75 @@
+"""SQLite с настраиваемыми PRAGMA для каждого нового соединения.
+
+Подключается через ``ENGINE = "yatube.sqlite3"``; PRAGMA берутся из ключа
+``PRAGMAS`` настроек базы и выполняются один раз при открытии соединения,
+поэтому с ``CONN_MAX_AGE`` они не повторяются на каждый запрос. Если в
+настройках базы ``CONN_HEALTH_CHECKS``, соединение перед повторным
+использованием проверяется: оно отвечает и файл базы не подменён.
+"""
+import os
+
+from django.core import checks
+from django.db.backends.base.validation import BaseDatabaseValidation
+from django.db.backends.sqlite3 import base
+
+# PRAGMA, которые SQLite возвращает числом, хотя задаются словом
+PRAGMA_VALUES = {
+    "synchronous": {"off": 0, "normal": 1, "full": 2, "extra": 3},
+    "temp_store": {"default": 0, "file": 1, "memory": 2},
+}
+
+
+class DatabaseValidation(BaseDatabaseValidation):
+    def check(self, **kwargs):
+        issues = super().check(**kwargs)
+        active = self.connection.active_pragmas()
+        for name, expected in self.connection.settings_dict.get("PRAGMAS", {}).items():
+            value = active[name]
+            expected = PRAGMA_VALUES.get(name, {}).get(str(expected).lower(), expected)
+            if str(value).lower() == str(expected).lower():
+                issues.append(checks.Info(f"PRAGMA {name} = {value}", obj=self.connection.alias,
+                                          id="yatube.I001"))
+            else:
+                issues.append(checks.Warning(f"PRAGMA {name} = {value}, в настройках {expected}",
+                                             obj=self.connection.alias, id="yatube.W001"))
+        return issues
+
+
+def file_id(name):
+    """``(устройство, inode)`` файла базы; ``None`` для базы в памяти."""
+    try:
+        stat = os.stat(name)
+    except (OSError, TypeError, ValueError):
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    validation_class = DatabaseValidation
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get("PRAGMAS", {}).items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        self.file_id = file_id(self.settings_dict["NAME"])
+        return conn
+
+    def is_usable(self):
+        """Соединение отвечает и открыто на том же файле, что лежит по пути базы."""
+        try:
+            self.connection.execute("SELECT 1")
+        except base.Database.Error:
+            return False
+        return file_id(self.settings_dict["NAME"]) == self.file_id
+
+    def close_if_unusable_or_obsolete(self):
+        if (self.connection is not None and self.settings_dict.get("CONN_HEALTH_CHECKS")
+                and not self.in_atomic_block and not self.is_usable()):
+            self.close()
+            return
+        super().close_if_unusable_or_obsolete()
+
+    def active_pragmas(self):
+        with self.cursor() as cursor:
+            return {name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                    for name in self.settings_dict.get("PRAGMAS", {})}
@@ -4,6 +4,8 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
+from . import metrics
+
 handler404 = "posts.views.page_not_found" # noqa
 handler500 = "posts.views.server_error" # noqa
 
@@ -12,7 +14,8 @@ urlpatterns = [
     path("about/", include("django.contrib.flatpages.urls")),
     path("auth/", include("users.urls")),
     path("auth/", include("django.contrib.auth.urls")),
-    path("game/", include("game.urls"))
+    path("game/", include("game.urls")),
+    path("metrics", metrics.view, name="metrics"),
 ]
 
 urlpatterns += [